@@ -1 +1,2 @@
-from .main import httsleep, HttSleeper
+from .main import httsleep, httsleep_any, HttSleeper, cancel_all
+from .spec import PollSpec
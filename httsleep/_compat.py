@@ -8,8 +8,16 @@ if not PY2:
     text_type = str
     string_types = (str,)
     integer_types = (int,)
+    from urllib.parse import urlsplit
+    import queue
+    from http.server import BaseHTTPRequestHandler, HTTPServer
+    from socketserver import ThreadingMixIn
 
 else:
     text_type = unicode
     string_types = (str, unicode)
     integer_types = (int, long)
+    from urlparse import urlsplit
+    import Queue as queue
+    from BaseHTTPServer import BaseHTTPRequestHandler, HTTPServer
+    from SocketServer import ThreadingMixIn
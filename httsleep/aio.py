@@ -0,0 +1,164 @@
+"""
+asyncio support for httsleep. Requires Python 3.5 or newer.
+"""
+import asyncio
+import logging
+import threading
+
+from .exceptions import MaxRetriesExceeded
+from .main import CANCEL_CHECK_INTERVAL, HttSleeper, _RUNNING, _RUNNING_LOCK
+
+
+class _CancelWatcher(object):
+    """ Waits in a thread of its own for a ``cancel_event`` shared between
+    AsyncHttSleepers, which may be set directly rather than through
+    :meth:`AsyncHttSleeper.cancel`, and wakes up the coroutines sleeping on it. A single
+    thread watches each event, however many coroutines sleep on it, and stops once none
+    of them does.
+    """
+    _watchers = {}
+    _lock = threading.Lock()
+
+    def __init__(self, cancel_event):
+        self.cancel_event = cancel_event
+        self.waiters = set()
+
+    @classmethod
+    def add(cls, cancel_event, loop, async_event):
+        with cls._lock:
+            watcher = cls._watchers.get(cancel_event)
+            if watcher is None:
+                watcher = cls._watchers[cancel_event] = cls(cancel_event)
+                thread = threading.Thread(target=watcher._watch)
+                thread.daemon = True
+                thread.start()
+            watcher.waiters.add((loop, async_event))
+
+    @classmethod
+    def discard(cls, cancel_event, loop, async_event):
+        with cls._lock:
+            watcher = cls._watchers.get(cancel_event)
+            if watcher is not None:
+                watcher.waiters.discard((loop, async_event))
+
+    def _watch(self):
+        while True:
+            is_set = self.cancel_event.wait(CANCEL_CHECK_INTERVAL)
+            with self._lock:
+                if is_set or not self.waiters:
+                    del self._watchers[self.cancel_event]
+                    waiters = list(self.waiters) if is_set else []
+                    break
+        for loop, async_event in waiters:
+            try:
+                loop.call_soon_threadsafe(async_event.set)
+            except RuntimeError:
+                # The loop has been closed in the meantime
+                pass
+
+
+class AsyncHttSleeper(HttSleeper):
+    """
+    An :class:`.HttSleeper` whose :meth:`run` method is a coroutine. It takes the
+    same parameters as :class:`.HttSleeper`.
+
+    Requests are sent through the HttSleeper's transport in the event loop's default
+    executor, and the waits between them don't block the event loop. Calling
+    :meth:`cancel` (from any thread) or :func:`httsleep.cancel_all` wakes the
+    coroutine up immediately, and so does setting a shared ``cancel_event``.
+
+    As coroutines can't raise :class:`StopIteration` (see PEP 479), a
+    :class:`.MaxRetriesExceeded` exception is raised instead once ``max_retries``
+    is reached.
+    """
+    _loop = None
+    _async_cancel_event = None
+
+    def cancel(self):
+        super(AsyncHttSleeper, self).cancel()
+        if self._loop is not None:
+            self._loop.call_soon_threadsafe(self._async_cancel_event.set)
+
+    async def _sleep(self, seconds):
+        shared = not self._owns_cancel_event
+        if shared:
+            _CancelWatcher.add(self.cancel_event, self._loop, self._async_cancel_event)
+        try:
+            if not self.cancelled:
+                await asyncio.wait_for(self._async_cancel_event.wait(), seconds)
+        except asyncio.TimeoutError:
+            pass
+        finally:
+            if shared:
+                _CancelWatcher.discard(self.cancel_event, self._loop,
+                                       self._async_cancel_event)
+
+    async def _wait_for_push_async(self, seconds):
+        """ Coroutine version of :meth:`.HttSleeper._wait_for_push`, which doesn't hold
+        a thread while waiting.
+        """
+        registration = self._register()
+        pushed = asyncio.Event()
+        registration.on_push = lambda: self._loop.call_soon_threadsafe(pushed.set)
+        shared = not self._owns_cancel_event
+        if shared:
+            _CancelWatcher.add(self.cancel_event, self._loop, pushed)
+        deadline = self._loop.time() + seconds
+        try:
+            while not self.cancelled:
+                response = registration.get_nowait()
+                if response is not None:
+                    # Evaluated in the executor, as conditions may be slow, e.g. callbacks
+                    response = await self._loop.run_in_executor(
+                        None, self._evaluate_push, response)
+                    if response is not None:
+                        return response
+                    continue
+                remaining = deadline - self._loop.time()
+                if remaining <= 0:
+                    break
+                # Pushes set the event through the loop, so none is missed by clearing it
+                pushed.clear()
+                try:
+                    await asyncio.wait_for(pushed.wait(), remaining)
+                except asyncio.TimeoutError:
+                    pass
+        finally:
+            registration.on_push = None
+            if shared:
+                _CancelWatcher.discard(self.cancel_event, self._loop, pushed)
+        return None
+
+    async def run(self):
+        """
+        Coroutine version of :meth:`.HttSleeper.run`.
+
+        :return: :class:`requests.Response` object.
+        """
+        self._loop = asyncio.get_event_loop()
+        self._async_cancel_event = asyncio.Event()
+        retries_left = self.max_retries
+        with _RUNNING_LOCK:
+            _RUNNING.add(self)
+        try:
+            while True:
+                response = await self._loop.run_in_executor(None, self.poll)
+                if response is not None:
+                    return response
+                if retries_left is not None:
+                    retries_left -= 1
+                    if retries_left <= 0:
+                        raise MaxRetriesExceeded("Maximum number of retries reached",
+                                                 self._history_records())
+                self._log(logging.INFO, 'Not ready, waiting %g seconds...', self.polling_interval)
+                if self.webhook is not None:
+                    response = await self._wait_for_push_async(self.polling_interval)
+                    if response is not None:
+                        return response
+                else:
+                    await self._sleep(self.polling_interval)
+        finally:
+            with _RUNNING_LOCK:
+                _RUNNING.discard(self)
+            self._close_registration()
+            self._loop = None
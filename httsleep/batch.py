@@ -0,0 +1,193 @@
+"""
+Polling many resources through a bulk status endpoint.
+"""
+import json
+
+import requests
+
+from .conditions import (BodyCache, ConditionIndex, check_conditions,
+                         normalize_conditions)
+from .exceptions import Alarm, Cancelled, RetriesExhausted
+from .main import (DEFAULT_MAX_RETRIES, DEFAULT_POLLING_INTERVAL, DEFAULT_SESSION,
+                   SYSTEM_CLOCK)
+from .transport import RequestsTransport
+
+
+DEFAULT_MAX_BATCH_SIZE = 50
+
+
+def make_response(value, status_code=200, request=None):
+    """ Wraps a JSON-serialisable value in a :class:`requests.Response`, so that
+    conditions can be evaluated against it.
+    """
+    response = requests.Response()
+    response.status_code = status_code
+    response._content = json.dumps(value).encode('utf-8')
+    response.encoding = 'utf-8'
+    response.headers['Content-Type'] = 'application/json'
+    if request is not None:
+        response.request = request
+        response.url = request.url
+    return response
+
+
+class _Waiter(object):
+    __slots__ = ('key', 'until_index', 'alarms_index', 'body_cache', 'retries_left', 'due')
+
+    def __init__(self, key, until, alarms, max_retries, due):
+        self.key = key
+        self.until_index = ConditionIndex(normalize_conditions(until, required=True))
+        self.alarms_index = ConditionIndex(normalize_conditions(alarms))
+        self.body_cache = BodyCache()
+        self.retries_left = int(max_retries) if max_retries is not None else None
+        self.due = due
+
+
+class BatchPoller(object):
+    """
+    Polls many resources through an API's bulk status endpoint (e.g.
+    ``GET /jobs?ids=a,b,c``), so that one request answers many waiters.
+
+    Waiters are added with :meth:`add`, each with its own success and error
+    conditions. On every tick, the waiters which are due are grouped into batches of
+    at most ``max_batch_size``, one request is sent per batch, and its response is
+    split up and evaluated against each waiter's conditions. Waiters which have
+    finished are left out of later batches.
+
+    :param build_request: a function which takes a list of keys and returns a
+                          :class:`requests.Request` for them.
+    :param split_response: a function which takes a batch's :class:`requests.Response`
+                           and its list of keys, and returns a dict mapping keys to
+                           their part of the response: either a
+                           :class:`requests.Response`, or a JSON-serialisable value,
+                           which is wrapped in a response with status code 200.
+                           Keys which are missing from the dict aren't ready yet.
+    :param max_batch_size: the maximum number of keys per request.
+    :param session: a Requests session.
+    :param transport: the :class:`.Transport` used to send requests. Defaults to sending
+                      them with ``session``.
+    :param verify: passed on to Requests, as for :class:`.HttSleeper`.
+    :param polling_interval: how many seconds to sleep between requests.
+    :param ignore_exceptions: a list of exceptions to ignore when sending a batch, or
+                              evaluating a waiter's conditions.
+    :param cancel_event: a :class:`threading.Event` which stops polling when set.
+    :param clock: the clock used to tell the time and wait between requests.
+    """
+    def __init__(self, build_request, split_response,
+                 max_batch_size=DEFAULT_MAX_BATCH_SIZE,
+                 session=DEFAULT_SESSION, verify=None,
+                 polling_interval=DEFAULT_POLLING_INTERVAL,
+                 ignore_exceptions=None,
+                 cancel_event=None,
+                 clock=None,
+                 transport=None):
+        if max_batch_size < 1:
+            raise ValueError('max_batch_size must be at least 1')
+        self.build_request = build_request
+        self.split_response = split_response
+        self.max_batch_size = int(max_batch_size)
+        self.session = session
+        self.transport = transport if transport is not None else RequestsTransport(session)
+        self.kwargs = {}
+        if verify is not None:
+            self.kwargs['verify'] = verify
+        self.polling_interval = polling_interval
+        self.ignore_exceptions = tuple(ignore_exceptions or [])
+        self.cancel_event = cancel_event
+        self.clock = clock or SYSTEM_CLOCK
+        self._waiters = []
+
+    def add(self, key, until=None, alarms=None, max_retries=DEFAULT_MAX_RETRIES):
+        """
+        Adds a waiter for the resource identified by ``key``.
+
+        :param until: success conditions, as for :class:`.HttSleeper`.
+        :param alarms: error conditions, as for :class:`.HttSleeper`.
+        :param max_retries: the maximum number of batches this waiter takes part in.
+        """
+        self._waiters.append(_Waiter(key, until, alarms, max_retries, self.clock.time()))
+
+    @property
+    def pending(self):
+        """ The keys of the waiters which haven't finished yet. """
+        return [waiter.key for waiter in self._waiters]
+
+    def _send_batch(self, keys):
+        request = self.build_request(keys)
+        response = self.transport.send(request, **self.kwargs)
+        parts = self.split_response(response, keys)
+        for key, part in parts.items():
+            if not isinstance(part, requests.Response):
+                parts[key] = make_response(part, request=response.request)
+        return parts
+
+    def _poll_batch(self, batch):
+        """ Polls a batch of waiters, and returns the ``(waiter, response, exception)``
+        tuples of those which have finished.
+        """
+        finished = []
+        try:
+            parts = self._send_batch([waiter.key for waiter in batch])
+        except self.ignore_exceptions:
+            parts = {}
+        except Exception as e:
+            return [(waiter, None, e) for waiter in batch]
+        for waiter in batch:
+            response = parts.get(waiter.key)
+            if response is None:
+                continue
+            try:
+                if check_conditions(response, waiter.until_index, waiter.alarms_index,
+                                    waiter.body_cache):
+                    finished.append((waiter, response, None))
+            except Alarm as e:
+                finished.append((waiter, None, e))
+            except self.ignore_exceptions:
+                pass
+            except Exception as e:
+                finished.append((waiter, None, e))
+        return finished
+
+    def run(self):
+        """
+        Polls until every waiter has finished. This is a generator, which yields a
+        ``(key, response, exception)`` tuple as soon as each waiter has finished,
+        like :func:`httsleep.scheduler.poll_many`:
+
+        * if a success condition was met, ``response`` is the waiter's part of the
+          response and ``exception`` is ``None``
+        * otherwise ``response`` is ``None`` and ``exception`` is the :class:`.Alarm`,
+          :class:`.RetriesExhausted` (when ``max_retries`` was reached), :class:`.Cancelled`
+          or other exception which stopped the waiter
+        """
+        while self._waiters:
+            if self.cancel_event is not None and self.cancel_event.is_set():
+                for waiter in self._waiters:
+                    yield waiter.key, None, Cancelled()
+                self._waiters = []
+                return
+            now = self.clock.time()
+            due = [waiter for waiter in self._waiters if waiter.due <= now]
+            if not due:
+                next_due = min(waiter.due for waiter in self._waiters)
+                self.clock.sleep(next_due - now, self.cancel_event)
+                continue
+            done = set()
+            for start in range(0, len(due), self.max_batch_size):
+                batch = due[start:start + self.max_batch_size]
+                for waiter, response, exception in self._poll_batch(batch):
+                    done.add(waiter)
+                    yield waiter.key, response, exception
+            next_due = self.clock.time() + self.polling_interval
+            for waiter in due:
+                if waiter in done:
+                    continue
+                if waiter.retries_left is not None:
+                    waiter.retries_left -= 1
+                    if waiter.retries_left <= 0:
+                        done.add(waiter)
+                        yield waiter.key, None, RetriesExhausted(
+                            "Maximum number of retries reached")
+                        continue
+                waiter.due = next_due
+            self._waiters = [waiter for waiter in self._waiters if waiter not in done]
@@ -0,0 +1,118 @@
+"""
+Microbenchmarks of condition evaluation.
+
+Measures how long it takes to evaluate a response against conditions of each kind, as
+the response body and the number of conditions grow. The responses are canned, so no
+requests are sent. Run it with::
+
+    python -m httsleep.benchmark --body-sizes 100 10000 --counts 1 100
+
+None of the conditions is met, so each of them which the index can't rule out is
+evaluated in full. No :class:`.BodyCache` is used, so each evaluation starts from
+scratch, as it does whenever a poller receives a new body.
+"""
+import argparse
+import sys
+import timeit
+
+from .batch import make_response
+from .conditions import ConditionIndex, check_conditions
+
+
+KINDS = ['status_code', 'json', 'text', 'jsonpath', 'callback']
+DEFAULT_BODY_SIZES = [100, 10000, 1000000] # in bytes
+DEFAULT_CONDITION_COUNTS = [1, 10, 100]
+DEFAULT_MIN_TIME = 0.2 # in seconds
+
+
+def make_body(size):
+    """ Returns the document of a pending job, with a log which makes it about ``size``
+    bytes long when encoded as JSON.
+    """
+    line = 'x' * 50
+    lines = max((size - 30) // (len(line) + 4), 0)
+    return {'status': 'PENDING', 'log': [line] * lines}
+
+
+def make_conditions(kind, count):
+    """ Returns ``count`` conditions of the given kind, none of which is met by a
+    response made from :func:`make_body`.
+    """
+    if kind == 'status_code':
+        return [{'status_code': 500 + i} for i in range(count)]
+    if kind == 'json':
+        return [{'json': {'status': 'FAILED-{}'.format(i)}} for i in range(count)]
+    if kind == 'text':
+        return [{'text': 'FAILED-{}'.format(i)} for i in range(count)]
+    if kind == 'jsonpath':
+        return [{'jsonpath': [{'expression': 'status', 'value': 'FAILED-{}'.format(i)}]}
+                for i in range(count)]
+    if kind == 'callback':
+        return [{'callback': lambda response: False} for _ in range(count)]
+    raise ValueError('Unknown kind of condition: {}'.format(kind))
+
+
+def time_per_call(function, min_time=DEFAULT_MIN_TIME):
+    """ Calls ``function`` repeatedly for at least ``min_time`` seconds, and returns the
+    average time per call, in seconds.
+    """
+    timer = timeit.Timer(function)
+    number = 1
+    while True:
+        elapsed = timer.timeit(number)
+        if elapsed >= min_time:
+            return elapsed / number
+        number *= 10
+
+
+def benchmark(kind, body_size, count, min_time=DEFAULT_MIN_TIME):
+    """
+    Returns how many seconds it takes to evaluate a response against ``count``
+    conditions of the given kind.
+
+    :param body_size: the approximate size of the response body, in bytes.
+    """
+    response = make_response(make_body(body_size))
+    until_index = ConditionIndex(make_conditions(kind, count))
+    alarms_index = ConditionIndex([])
+    # Compile the jsonpath expressions before timing
+    check_conditions(response, until_index, alarms_index)
+    return time_per_call(lambda: check_conditions(response, until_index, alarms_index),
+                         min_time)
+
+
+def run_benchmarks(kinds=None, body_sizes=None, counts=None, min_time=DEFAULT_MIN_TIME):
+    """ Runs :func:`benchmark` for every combination of the given kinds, body sizes and
+    condition counts, yielding a ``(kind, body_size, count, seconds)`` tuple for each.
+    """
+    for kind in kinds or KINDS:
+        for body_size in body_sizes or DEFAULT_BODY_SIZES:
+            for count in counts or DEFAULT_CONDITION_COUNTS:
+                yield kind, body_size, count, benchmark(kind, body_size, count, min_time)
+
+
+def main(argv=None, stdout=None):
+    stdout = stdout or sys.stdout
+    parser = argparse.ArgumentParser(
+        prog='python -m httsleep.benchmark',
+        description='Measure the cost of evaluating conditions.')
+    parser.add_argument('--kinds', nargs='+', choices=KINDS, default=KINDS)
+    parser.add_argument('--body-sizes', nargs='+', type=int, default=DEFAULT_BODY_SIZES,
+                        help='approximate response body sizes, in bytes')
+    parser.add_argument('--counts', nargs='+', type=int, default=DEFAULT_CONDITION_COUNTS,
+                        help='numbers of conditions')
+    parser.add_argument('--min-time', type=float, default=DEFAULT_MIN_TIME,
+                        help='minimum time to spend on each measurement, in seconds')
+    args = parser.parse_args(argv)
+    stdout.write('{:<12} {:>10} {:>10} {:>14}\n'.format(
+        'kind', 'body size', 'conditions', 'usec/eval'))
+    for kind, body_size, count, seconds in run_benchmarks(
+            args.kinds, args.body_sizes, args.counts, args.min_time):
+        stdout.write('{:<12} {:>10} {:>10} {:>14.2f}\n'.format(
+            kind, body_size, count, seconds * 1e6))
+        stdout.flush()
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,158 @@
+"""
+Command-line interface for httsleep.
+
+Waits on one or more targets concurrently, and writes one JSON line to stdout per
+target as soon as it has finished. The exit code tells how the slowest-to-please
+target fared:
+
+* ``0``: every target met a success condition
+* ``1``: an unexpected error occurred
+* ``2``: the command line was invalid
+* ``3``: at least one target met an alarm condition
+* ``4``: at least one target ran out of retries
+"""
+import argparse
+import json
+import sys
+
+from .exceptions import Alarm
+from .main import DEFAULT_MAX_RETRIES, DEFAULT_POLLING_INTERVAL, HttSleeper
+from .scheduler import DEFAULT_MAX_WORKERS, poll_many
+
+
+EXIT_SUCCESS = 0
+EXIT_ERROR = 1
+EXIT_USAGE = 2
+EXIT_ALARM = 3
+EXIT_RETRIES_EXHAUSTED = 4
+# When targets finish differently, the outcome listed first wins
+EXIT_CODE_PRECEDENCE = [EXIT_ERROR, EXIT_ALARM, EXIT_RETRIES_EXHAUSTED, EXIT_SUCCESS]
+
+TARGET_KEYS = ['id', 'url', 'until', 'alarms', 'polling_interval', 'max_retries']
+
+
+def _json_arg(value):
+    try:
+        return json.loads(value)
+    except ValueError as e:
+        raise argparse.ArgumentTypeError('invalid JSON: {}'.format(e))
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(
+        prog='httsleep',
+        description='Poll HTTP endpoints until they meet a success condition.',
+        epilog='Exit codes: 0 success, 1 error, 2 usage, 3 alarm, 4 retries exhausted.')
+    parser.add_argument('urls', nargs='*', metavar='URL', help='a URL to poll')
+    parser.add_argument('-f', '--file', type=argparse.FileType('r'),
+                        help='a JSON-lines file of targets ("-" for stdin). Each line is an '
+                             'object with a "url" and optionally "id", "until", "alarms", '
+                             '"polling_interval" and "max_retries", which default to the '
+                             'values given on the command line.')
+    parser.add_argument('-u', '--until', type=_json_arg, action='append',
+                        help='a success condition as JSON, e.g. \'{"status_code": 200}\'. '
+                             'May be given several times. Defaults to a status code of 200.')
+    parser.add_argument('-a', '--alarm', type=_json_arg, action='append', dest='alarms',
+                        help='an error condition as JSON. May be given several times.')
+    parser.add_argument('-i', '--polling-interval', type=float,
+                        default=DEFAULT_POLLING_INTERVAL,
+                        help='seconds to wait between requests (default: %(default)s)')
+    parser.add_argument('-n', '--max-retries', type=int, default=DEFAULT_MAX_RETRIES,
+                        help='the maximum number of requests per target (default: %(default)s)')
+    parser.add_argument('-c', '--concurrency', type=int, default=DEFAULT_MAX_WORKERS,
+                        help='the maximum number of requests in flight (default: %(default)s)')
+    parser.add_argument('--ignore-connection-errors', action='store_true',
+                        help='keep polling when a connection error occurs')
+    return parser
+
+
+def load_targets(args):
+    """ Returns a list of target dicts from the command-line arguments. """
+    defaults = {
+        'until': args.until or [{'status_code': 200}],
+        'alarms': args.alarms,
+        'polling_interval': args.polling_interval,
+        'max_retries': args.max_retries,
+    }
+    targets = []
+    for url in args.urls:
+        target = dict(defaults, url=url)
+        targets.append(target)
+    if args.file is not None:
+        for line_number, line in enumerate(args.file, 1):
+            if not line.strip():
+                continue
+            try:
+                target = json.loads(line)
+            except ValueError as e:
+                raise ValueError('line {}: invalid JSON: {}'.format(line_number, e))
+            if not isinstance(target, dict) or 'url' not in target:
+                raise ValueError('line {}: a target must be an object with a "url"'.format(
+                    line_number))
+            for key in target:
+                if key not in TARGET_KEYS:
+                    raise ValueError('line {}: invalid key "{}"'.format(line_number, key))
+            targets.append(dict(defaults, **target))
+    for index, target in enumerate(targets):
+        target.setdefault('id', index)
+    return targets
+
+
+def build_sleeper(target, ignore_exceptions):
+    return HttSleeper(target['url'], until=target['until'], alarms=target['alarms'],
+                      polling_interval=target['polling_interval'],
+                      max_retries=target['max_retries'],
+                      ignore_exceptions=ignore_exceptions)
+
+
+def format_result(target, response, exception):
+    """ Returns the JSON-serialisable result for a finished target, and its exit code. """
+    result = {'id': target['id'], 'url': target['url']}
+    if exception is None:
+        result['result'] = 'success'
+        result['status_code'] = response.status_code
+        return result, EXIT_SUCCESS
+    if isinstance(exception, Alarm):
+        result['result'] = 'alarm'
+        result['status_code'] = exception.response.status_code
+        result['alarm'] = exception.alarm
+        return result, EXIT_ALARM
+    if isinstance(exception, StopIteration):
+        result['result'] = 'retries_exhausted'
+        return result, EXIT_RETRIES_EXHAUSTED
+    result['result'] = 'error'
+    result['error'] = '{}: {}'.format(type(exception).__name__, exception)
+    return result, EXIT_ERROR
+
+
+def main(argv=None, stdout=None):
+    parser = build_parser()
+    args = parser.parse_args(argv)
+    stdout = stdout or sys.stdout
+    ignore_exceptions = None
+    if args.ignore_connection_errors:
+        from requests.exceptions import ConnectionError
+        ignore_exceptions = [ConnectionError]
+    try:
+        targets = load_targets(args)
+        sleepers = dict((build_sleeper(target, ignore_exceptions), target)
+                        for target in targets)
+    except ValueError as e:
+        parser.error(str(e))
+    if not sleepers:
+        parser.error('no targets given')
+
+    exit_codes = set()
+    for sleeper, response, exception in poll_many(sleepers, max_workers=args.concurrency):
+        result, exit_code = format_result(sleepers[sleeper], response, exception)
+        exit_codes.add(exit_code)
+        stdout.write(json.dumps(result, default=str) + '\n')
+        stdout.flush()
+    for exit_code in EXIT_CODE_PRECEDENCE:
+        if exit_code in exit_codes:
+            return exit_code
+
+
+def run():
+    """ Entry point of the ``httsleep`` console script. """
+    sys.exit(main())
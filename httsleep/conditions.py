@@ -0,0 +1,325 @@
+"""
+Compilation and indexing of success and error conditions.
+
+Conditions are compiled once, when they are set, so that polling only has to do
+the work which depends on the response. They are indexed, so that only the
+conditions which could possibly match a response have to be evaluated against it.
+"""
+import hashlib
+
+from ._compat import string_types
+from .exceptions import Alarm
+
+
+VALID_CONDITIONS = ['status_code', 'headers', 'json', 'jsonpath', 'text', 'callback']
+# Indexing ``json`` conditions means freezing every response body, which only pays off
+# once there are enough of them to compare against
+JSON_INDEX_MIN_CONDITIONS = 4
+
+_MISSING = object()
+
+
+def normalize_conditions(conditions, required=False):
+    """
+    Validates success or error conditions, given as a dict or a list of dicts, and
+    returns them as a list. Empty dicts are ignored.
+
+    :param required: whether at least one condition must be given.
+    :raises ValueError: if a condition is invalid, or none is given when required.
+    """
+    value = []
+    if isinstance(conditions, dict):
+        conditions = [conditions]
+    if conditions:
+        for condition in conditions:
+            if not condition:
+                # ignore empty dicts
+                continue
+            for key in condition:
+                if key not in VALID_CONDITIONS:
+                    raise ValueError(
+                        'Invalid key "{}" in condition: {}'.format(key, condition))
+            if condition.get('status_code'):
+                condition['status_code'] = int(condition['status_code'])
+            # TODO: Add validation for jsonpath
+            value.append(condition)
+
+    if value == [] and required:
+        raise ValueError('No valid success conditions provided')
+    return value
+
+
+def freeze(value):
+    """
+    Returns a hashable version of a JSON-decoded value. Two values which compare
+    equal have frozen versions which compare equal (and hash the same), so these
+    can be used as keys when looking up expected JSON documents.
+
+    :raises TypeError: if the value contains something unhashable which isn't a
+                       dict or a list.
+    """
+    if isinstance(value, dict):
+        return frozenset((key, freeze(item)) for key, item in value.items())
+    if isinstance(value, (list, tuple)):
+        return tuple(freeze(item) for item in value)
+    hash(value)
+    return value
+
+
+# JSON decoding, jsonpath matching and callbacks go through these functions, so that
+# profiles can attribute time to them (see :class:`httsleep.profiling.PollProfiler`)
+def _decode_json(response):
+    return response.json()
+
+
+def _find_jsonpath(expression, document):
+    return expression.find(document)
+
+
+def _call_callback(callback, response):
+    return callback(response)
+
+
+class CompiledJSON(object):
+    """
+    An expected JSON document, prepared for fast comparison. Documents which don't
+    have the same type, length or (for objects) keys at the top level are rejected
+    without comparing their contents.
+    """
+    __slots__ = ('value', 'frozen', 'keys')
+
+    def __init__(self, value):
+        self.value = value
+        try:
+            self.frozen = freeze(value)
+        except TypeError:
+            self.frozen = None
+        if isinstance(value, dict):
+            self.keys = frozenset(value)
+        else:
+            self.keys = None
+
+    def matches(self, document):
+        if self.keys is not None:
+            if not isinstance(document, dict) or len(document) != len(self.keys):
+                return False
+            if not self.keys.issuperset(document):
+                return False
+        elif isinstance(self.value, list):
+            if not isinstance(document, list) or len(document) != len(self.value):
+                return False
+        return document == self.value
+
+
+class CompiledCondition(object):
+    """
+    A condition dict, compiled for repeated evaluation.
+
+    :param condition: a condition dict, as passed in ``until`` or ``alarms``.
+    """
+    def __init__(self, condition):
+        self.condition = condition
+        self.status_code = condition.get('status_code')
+        self.headers = condition.get('headers')
+        self.json = CompiledJSON(condition['json']) if condition.get('json') else None
+        self.text = condition.get('text')
+        self.jsonpath = condition.get('jsonpath')
+        self.callback = condition.get('callback')
+        self.needs_body = bool(self.json or self.text or self.jsonpath)
+        self._jsonpath_expressions = None
+
+    def _compile_jsonpath(self):
+        expressions = []
+        for jsonpath in self.jsonpath:
+            if isinstance(jsonpath['expression'], string_types):
+                # imported lazily, as it's slow to import and not always needed
+                import jsonpath_rw
+                expression = jsonpath_rw.parse(jsonpath['expression'])
+            else:
+                expression = jsonpath['expression']
+            expressions.append((expression, jsonpath['value']))
+        return expressions
+
+    def meets_body(self, response, body=None):
+        """ Evaluates the ``json``, ``text`` and ``jsonpath`` parts of the condition. """
+        if self.json:
+            document = body.json(response) if body else _decode_json(response)
+            if not self.json.matches(document):
+                return False
+        if self.text and response.text != self.text:
+            return False
+        if self.jsonpath:
+            if self._jsonpath_expressions is None:
+                self._jsonpath_expressions = self._compile_jsonpath()
+            document = body.json(response) if body else _decode_json(response)
+            for expression, value in self._jsonpath_expressions:
+                results = _find_jsonpath(expression, document)
+                if not results:
+                    return False
+                elif len(results) == 1:
+                    if results[0].value != value:
+                        return False
+                else:
+                    if [result.value for result in results] != value:
+                        return False
+        return True
+
+    def meets(self, response, body=None):
+        """
+        Returns whether ``response`` meets the condition. If a :class:`BodyCache`
+        is given, the verdict on the response body is looked up in (or stored to)
+        it, rather than being evaluated again for an identical body.
+        """
+        if self.status_code and response.status_code != self.status_code:
+            return False
+        if self.headers:
+            for name, value in self.headers.items():
+                if response.headers.get(name) != value:
+                    return False
+        if self.needs_body:
+            if body is None:
+                verdict = self.meets_body(response)
+            else:
+                verdict = body.verdict(self, response)
+            if not verdict:
+                return False
+        if self.callback:
+            if _call_callback(self.callback, response) == True:
+                pass
+            else:
+                return False
+        return True
+
+
+class BodyCache(object):
+    """
+    Remembers the decoded JSON of the last response body seen, and the verdicts of
+    the conditions evaluated against it. Pollers mostly receive the same body over
+    and over again, until it finally changes; while it doesn't, decoding and
+    comparing it again is skipped.
+
+    A digest of the body is only computed once some condition needs the body.
+    """
+    def __init__(self):
+        self._digest = None
+        self._json = _MISSING
+        self._frozen = _MISSING
+        self._verdicts = {}
+        self._response = None
+
+    def bind(self, response):
+        """ Starts evaluating conditions against a new response. """
+        self._response = response
+
+    def _refresh(self):
+        if self._response is None:
+            return
+        digest = hashlib.sha1(self._response.content or b'').digest()
+        self._response = None
+        if digest != self._digest:
+            self._digest = digest
+            self._json = _MISSING
+            self._frozen = _MISSING
+            self._verdicts = {}
+
+    def digest(self):
+        """ Returns the SHA-1 digest of the body of the last response bound. """
+        self._refresh()
+        return self._digest
+
+    def json(self, response):
+        self._refresh()
+        if self._json is _MISSING:
+            self._json = _decode_json(response)
+        return self._json
+
+    def frozen(self, response):
+        """ Returns the :func:`freeze`-d decoded JSON of the response body. """
+        self._refresh()
+        if self._frozen is _MISSING:
+            self._frozen = freeze(self.json(response))
+        return self._frozen
+
+    def verdict(self, compiled_condition, response):
+        self._refresh()
+        verdict = self._verdicts.get(compiled_condition)
+        if verdict is None:
+            verdict = compiled_condition.meets_body(response, self)
+            self._verdicts[compiled_condition] = verdict
+        return verdict
+
+
+class ConditionIndex(object):
+    """
+    Compiles a list of conditions and indexes them by the value they expect, so
+    that looking up the conditions which might be met by a response doesn't depend
+    on the number of conditions.
+
+    Each condition is indexed by its most discriminating key: ``text``, then
+    ``json`` (if there are at least ``JSON_INDEX_MIN_CONDITIONS`` of them), then
+    ``status_code``. Conditions with none of these are always candidates. A
+    candidate may still turn out not to be met by the response, so each one must be
+    evaluated in full with :meth:`CompiledCondition.meets`.
+
+    :param conditions: a list of condition dicts.
+    """
+    def __init__(self, conditions):
+        self.conditions = [CompiledCondition(condition) for condition in conditions]
+        self._by_text = {}
+        self._by_json = {}
+        self._by_status_code = {}
+        self._unindexed = []
+        index_json = len([compiled for compiled in self.conditions
+                          if compiled.json and not compiled.text]) >= JSON_INDEX_MIN_CONDITIONS
+        for position, compiled in enumerate(self.conditions):
+            if compiled.text:
+                self._by_text.setdefault(compiled.text, []).append(position)
+            elif index_json and compiled.json and compiled.json.frozen is not None:
+                self._by_json.setdefault(compiled.json.frozen, []).append(position)
+            elif compiled.status_code:
+                self._by_status_code.setdefault(compiled.status_code, []).append(position)
+            else:
+                self._unindexed.append(position)
+
+    def _json_candidates(self, response, body):
+        try:
+            key = body.frozen(response) if body else freeze(_decode_json(response))
+        except (ValueError, TypeError):
+            # Let the conditions themselves raise the decoding error, as they
+            # would have done without the index
+            return [position for positions in self._by_json.values() for position in positions]
+        return self._by_json.get(key, [])
+
+    def candidates(self, response, body=None):
+        """
+        Returns the :class:`CompiledCondition` objects which might be met by
+        ``response``, in the order in which they were given. The response body is
+        only read if some condition is indexed by ``text`` or ``json``.
+        """
+        positions = list(self._unindexed)
+        positions.extend(self._by_status_code.get(response.status_code, []))
+        if self._by_text:
+            positions.extend(self._by_text.get(response.text, []))
+        if self._by_json:
+            positions.extend(self._json_candidates(response, body))
+        return [self.conditions[position] for position in sorted(positions)]
+
+
+def check_conditions(response, until_index, alarms_index, body=None):
+    """
+    Evaluates a response against indexed success and error conditions.
+
+    :param body: an optional :class:`BodyCache` for the poller which received the
+                 response.
+    :raises Alarm: if the response meets an error condition.
+    :return: the first success condition dict met by the response, or ``None``.
+    """
+    if body is not None:
+        body.bind(response)
+    for compiled in alarms_index.candidates(response, body):
+        if compiled.meets(response, body):
+            raise Alarm(response, compiled.condition)
+    for compiled in until_index.candidates(response, body):
+        if compiled.meets(response, body):
+            return compiled.condition
+    return None
@@ -0,0 +1,164 @@
+"""
+In-process DNS caching for Requests sessions.
+
+Each new connection normally resolves its host again. A :class:`DNSCache` remembers
+the addresses of each host for a while, so that bursts of new connections (e.g. when
+many pollers start at once, or when connections are pre-warmed with
+:meth:`.RequestsTransport.prewarm`) only resolve it once.
+"""
+import socket
+import threading
+import time
+
+from requests.adapters import DEFAULT_POOLBLOCK, DEFAULT_POOLSIZE, DEFAULT_RETRIES, HTTPAdapter
+from urllib3.poolmanager import pool_classes_by_scheme
+
+
+DEFAULT_DNS_TTL = 60 # in seconds
+
+
+class DNSCache(object):
+    """
+    A thread-safe cache of the addresses hosts resolve to.
+
+    :param ttl: how many seconds addresses are cached for.
+    :param clock: the clock used to expire addresses, as for :class:`.HttSleeper`.
+                  Defaults to real time.
+    """
+    def __init__(self, ttl=DEFAULT_DNS_TTL, clock=None):
+        self.ttl = ttl
+        self.clock = clock
+        self.hits = 0
+        self.misses = 0
+        self._entries = {}
+        self._resolving = {}
+        self._lock = threading.Lock()
+
+    def _time(self):
+        return self.clock.time() if self.clock is not None else time.time()
+
+    def resolve(self, host, port):
+        """
+        Returns the IP addresses of ``host``, from the cache if they haven't expired.
+        If the host is already being resolved by another thread, waits for its result
+        rather than resolving it again.
+
+        :raises socket.gaierror: if the host can't be resolved.
+        """
+        key = (host, port)
+        now = self._time()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[0] > now:
+                self.hits += 1
+                return entry[1]
+            resolution = self._resolving.get(key)
+            resolving = resolution is None
+            if resolving:
+                resolution = self._resolving[key] = _Resolution()
+        if not resolving:
+            resolution.done.wait()
+            if resolution.error is not None:
+                raise resolution.error
+            with self._lock:
+                self.hits += 1
+            return resolution.addresses
+        try:
+            addresses = []
+            for _, _, _, _, sockaddr in socket.getaddrinfo(host, port, 0, socket.SOCK_STREAM):
+                if sockaddr[0] not in addresses:
+                    addresses.append(sockaddr[0])
+            resolution.addresses = addresses
+        except Exception as e:
+            resolution.error = e
+            raise
+        finally:
+            with self._lock:
+                self.misses += 1
+                if resolution.error is None:
+                    self._entries[key] = (now + self.ttl, resolution.addresses)
+                del self._resolving[key]
+            resolution.done.set()
+        return addresses
+
+    def invalidate(self, host, port):
+        """ Forgets the addresses of ``host``, e.g. after failing to connect to them. """
+        with self._lock:
+            self._entries.pop((host, port), None)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+
+class _Resolution(object):
+    """ The result of resolving a host, which other threads may be waiting for. """
+    def __init__(self):
+        self.done = threading.Event()
+        self.addresses = None
+        self.error = None
+
+
+class _CachingConnectionMixin(object):
+    """ Makes a urllib3 connection connect to the addresses from its ``dns_cache``, in
+    turn, until one accepts it. The original host name is still used for the ``Host``
+    header and TLS verification.
+    """
+    dns_cache = None
+
+    def _new_conn(self):
+        host = self._dns_host
+        try:
+            addresses = self.dns_cache.resolve(host, self.port)
+        except socket.gaierror:
+            # Let urllib3 fail to resolve the host, and raise its usual exception
+            return super(_CachingConnectionMixin, self)._new_conn()
+        if not addresses:
+            return super(_CachingConnectionMixin, self)._new_conn()
+        try:
+            for index, address in enumerate(addresses):
+                self._dns_host = address
+                try:
+                    return super(_CachingConnectionMixin, self)._new_conn()
+                except Exception:
+                    if index == len(addresses) - 1:
+                        # The cached addresses may be stale, so resolve the host again
+                        # next time
+                        self.dns_cache.invalidate(host, self.port)
+                        raise
+        finally:
+            self._dns_host = host
+
+
+def _caching_pool_classes(dns_cache):
+    pool_classes = {}
+    for scheme, pool_class in pool_classes_by_scheme.items():
+        connection_class = type(pool_class.ConnectionCls.__name__,
+                                (_CachingConnectionMixin, pool_class.ConnectionCls),
+                                {'dns_cache': dns_cache})
+        pool_classes[scheme] = type(pool_class.__name__, (pool_class,),
+                                    {'ConnectionCls': connection_class})
+    return pool_classes
+
+
+class DNSCachingAdapter(HTTPAdapter):
+    """
+    A Requests transport adapter whose connections resolve hosts through a
+    :class:`DNSCache`. Connections through a proxy don't use it.
+
+    :param dns_cache: the :class:`DNSCache`, which may be shared between adapters.
+
+    The other parameters are the same as for :class:`requests.adapters.HTTPAdapter`.
+    """
+    def __init__(self, dns_cache, pool_connections=DEFAULT_POOLSIZE,
+                 pool_maxsize=DEFAULT_POOLSIZE, max_retries=DEFAULT_RETRIES,
+                 pool_block=DEFAULT_POOLBLOCK):
+        self.dns_cache = dns_cache
+        super(DNSCachingAdapter, self).__init__(
+            pool_connections=pool_connections, pool_maxsize=pool_maxsize,
+            max_retries=max_retries, pool_block=pool_block)
+
+    def init_poolmanager(self, connections, maxsize, block=DEFAULT_POOLBLOCK, **pool_kwargs):
+        super(DNSCachingAdapter, self).init_poolmanager(connections, maxsize, block,
+                                                        **pool_kwargs)
+        self.poolmanager.pool_classes_by_scheme = _caching_pool_classes(self.dns_cache)
@@ -4,8 +4,53 @@ class Alarm(Exception):
 
     * response: The response the matched the alarm condition
     * alarm: The alarm condition that was triggered
+    * history: The :class:`.PollRecord` objects of the last attempts, if the HttSleeper
+      keeps a history (see ``history_size``), otherwise ``None``
     """
-    def __init__(self, response, alarm_condition):
+    def __init__(self, response, alarm_condition, history=None):
         self.response = response
         self.alarm = alarm_condition
+        self.history = history
         self.mesg = 'Response matched an error condition: {}'.format(alarm_condition)
+
+
+class Cancelled(Exception):
+    """ Exception raised when a HttSleeper has been cancelled while polling, e.g. by
+    calling :meth:`httsleep.HttSleeper.cancel` or :func:`httsleep.cancel_all`.
+    """
+
+
+class RetriesExhausted(StopIteration):
+    """ Exception raised by :meth:`httsleep.HttSleeper.run` when the maximum number of
+    retries has been reached. It is a :class:`StopIteration`, as raised by earlier
+    versions, with an extra attribute:
+
+    * history: The :class:`.PollRecord` objects of the last attempts, if the HttSleeper
+      keeps a history (see ``history_size``), otherwise ``None``
+    """
+    def __init__(self, message, history=None):
+        super(RetriesExhausted, self).__init__(message)
+        self.history = history
+
+
+class MaxRetriesExceeded(Exception):
+    """ Exception raised by :meth:`httsleep.aio.AsyncHttSleeper.run` when the maximum
+    number of retries has been reached. Coroutines can't raise :class:`StopIteration`
+    (see PEP 479), so this is raised in its place. Like :class:`RetriesExhausted`, it
+    has a ``history`` attribute.
+    """
+    def __init__(self, message, history=None):
+        super(MaxRetriesExceeded, self).__init__(message)
+        self.history = history
+
+
+class LimitExceeded(Alarm):
+    """ Exception raised when a response is larger than ``max_body_size``, or its content
+    type isn't one of ``content_types`` (see :class:`httsleep.HttSleeper`). It is an
+    :class:`Alarm`, whose ``alarm`` attribute is a dict describing the limit, e.g.
+    ``{'max_body_size': 1048576}``. The response body is discarded unread, so it isn't
+    available on ``response``.
+    """
+    def __init__(self, response, limit, history=None):
+        super(LimitExceeded, self).__init__(response, limit, history)
+        self.mesg = 'Response exceeded a limit: {}'.format(limit)
@@ -0,0 +1,77 @@
+"""
+Bounded records of the attempts made while polling.
+"""
+import collections
+
+
+PENDING = 'pending'
+SUCCESS = 'success'
+ALARM = 'alarm'
+ERROR = 'error'
+
+
+class PollRecord(object):
+    """
+    A compact record of a single attempt. The response itself isn't kept.
+
+    * ``timestamp``: when the request was sent, according to the poller's clock
+    * ``latency``: how many seconds it took to receive the response, or ``None`` (e.g.
+      for a payload pushed to a webhook)
+    * ``status_code``: the status code of the response, or ``None``
+    * ``body_size``: the length of the response body, in bytes, or ``None``
+    * ``body_digest``: the SHA-1 digest of the response body, or ``None``
+    * ``outcome``: ``'pending'``, ``'success'``, ``'alarm'`` or ``'error'`` (for an
+      ignored exception)
+    * ``condition``: for successes and alarms, the position of the condition which was
+      met in ``until`` or ``alarms`` respectively, otherwise ``None``
+    """
+    __slots__ = ('timestamp', 'latency', 'status_code', 'body_size', 'body_digest',
+                 'outcome', 'condition')
+
+    def __init__(self, timestamp, latency, status_code, body_size, body_digest,
+                 outcome, condition=None):
+        self.timestamp = timestamp
+        self.latency = latency
+        self.status_code = status_code
+        self.body_size = body_size
+        self.body_digest = body_digest
+        self.outcome = outcome
+        self.condition = condition
+
+    def __repr__(self):
+        return '<PollRecord {} status_code={} latency={}>'.format(
+            self.outcome, self.status_code, self.latency)
+
+
+class PollHistory(object):
+    """
+    A ring buffer of the last ``size`` :class:`PollRecord` objects, so that its memory
+    use stays fixed however many attempts are made.
+
+    :param size: the number of records to keep.
+    """
+    def __init__(self, size):
+        if size < 1:
+            raise ValueError('size must be at least 1')
+        self._records = collections.deque(maxlen=int(size))
+
+    def __len__(self):
+        return len(self._records)
+
+    def __iter__(self):
+        return iter(self.records())
+
+    def append(self, record):
+        self._records.append(record)
+
+    def records(self):
+        """ Returns the records, oldest first, as a list. """
+        return list(self._records)
+
+
+def position(conditions, condition):
+    """ Returns the position of a condition dict in a list of them, by identity. """
+    for index, candidate in enumerate(conditions):
+        if candidate is condition:
+            return index
+    return None
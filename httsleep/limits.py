@@ -0,0 +1,61 @@
+"""
+Limits on the responses a poller accepts, enforced while the body is read.
+"""
+from .exceptions import LimitExceeded
+
+
+ON_LIMIT_ALARM = 'alarm'
+ON_LIMIT_RETRY = 'retry'
+ON_LIMIT_CHOICES = [ON_LIMIT_ALARM, ON_LIMIT_RETRY]
+CHUNK_SIZE = 64 * 1024
+
+
+def media_type(content_type):
+    """ Returns the media type of a ``Content-Type`` header, without its parameters,
+    e.g. ``'application/json'`` for ``'application/json; charset=utf-8'``.
+    """
+    return content_type.split(';', 1)[0].strip().lower()
+
+
+def _reject(response, limit):
+    # Closing the response drops the connection rather than reading the rest of the body
+    response.close()
+    response._content = None
+    raise LimitExceeded(response, limit)
+
+
+def enforce_limits(response, max_body_size=None, content_types=None):
+    """
+    Checks a response against limits on its body size and content type. The body of
+    a response sent with ``stream=True`` is read in chunks, and reading stops as soon
+    as it grows larger than ``max_body_size``, so that no more than this is ever held
+    in memory.
+
+    :param max_body_size: the maximum size of the (decoded) body, in bytes.
+    :param content_types: a list of accepted media types, e.g. ``['application/json']``.
+    :raises LimitExceeded: if the response exceeds a limit. Its body is discarded.
+    """
+    if content_types is not None:
+        if media_type(response.headers.get('Content-Type', '')) not in content_types:
+            _reject(response, {'content_types': content_types})
+    if max_body_size is None or (response.request is not None and
+                                  response.request.method == 'HEAD'):
+        # Read the accepted body, which releases the connection of a streamed response
+        response.content
+        return
+    limit = {'max_body_size': max_body_size}
+    content_length = response.headers.get('Content-Length', '')
+    if content_length.isdigit() and int(content_length) > max_body_size:
+        _reject(response, limit)
+    if response._content is False:
+        # The body hasn't been read yet
+        chunks = []
+        size = 0
+        for chunk in response.iter_content(CHUNK_SIZE):
+            size += len(chunk)
+            if size > max_body_size:
+                _reject(response, limit)
+            chunks.append(chunk)
+        response._content = b''.join(chunks)
+    if len(response.content or b'') > max_body_size:
+        _reject(response, limit)
@@ -1,19 +1,87 @@
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
+import collections
+import copy
 import logging
-from time import sleep
+import threading
+import time
 import warnings
+import weakref
 
-import jsonpath_rw
 import requests
 
-from .exceptions import Alarm
+from .conditions import (VALID_CONDITIONS, BodyCache, CompiledCondition, ConditionIndex,
+                         check_conditions, normalize_conditions)
+from .exceptions import Alarm, Cancelled, LimitExceeded, RetriesExhausted
 from ._compat import string_types
+from .history import ALARM, ERROR, PENDING, SUCCESS, PollHistory, PollRecord, position
+from .limits import ON_LIMIT_ALARM, ON_LIMIT_CHOICES, ON_LIMIT_RETRY, enforce_limits
+from .ratelimit import get_default_rate_limiter
+from .transport import RequestsTransport
 
 
 DEFAULT_POLLING_INTERVAL = 2 # in seconds
 DEFAULT_MAX_RETRIES = 50
-VALID_CONDITIONS = ['status_code', 'json', 'jsonpath', 'text', 'callback']
+# Number of latency samples kept for, and needed before, percentile-based hedging
+HEDGE_LATENCY_SAMPLES = 100
+HEDGE_MIN_SAMPLES = 10
+# Conditions which can be evaluated without the response body
+BODYLESS_CONDITIONS = ['status_code', 'headers']
+# Status codes with which servers reject HEAD requests
+HEAD_REJECTED_STATUS_CODES = [405, 501]
+# How often a HttSleeper which is woken up by another event checks whether its
+# cancel_event was set
+CANCEL_CHECK_INTERVAL = 1 # in seconds
+# How often a HttSleeper waiting for a webhook checks whether its cancel_event was set
+WEBHOOK_WAKEUP_INTERVAL = 1 # in seconds
 DEFAULT_SESSION = requests.Session()
 
+log = logging.getLogger('httsleep')
+
+# HttSleeper objects which are currently running, so that they can all be
+# woken up and stopped by :func:`cancel_all`.
+_RUNNING = weakref.WeakSet()
+_RUNNING_LOCK = threading.Lock()
+
+
+def sleep(seconds, cancel_event=None):
+    """ Sleeps for ``seconds``. If a ``cancel_event`` is given, the sleep is
+    cut short as soon as the event is set.
+    """
+    if cancel_event is None:
+        time.sleep(seconds)
+    else:
+        cancel_event.wait(seconds)
+
+
+class SystemClock(object):
+    """ The clock used by HttSleeper objects by default, which tells and waits in
+    real time.
+
+    A clock can be replaced by any object with the same two methods, e.g. a
+    :class:`httsleep.simulation.VirtualClock`.
+    """
+    def time(self):
+        """ Returns the current time, in seconds. """
+        return time.time()
+
+    def sleep(self, seconds, cancel_event=None):
+        """ Waits for ``seconds``, or until ``cancel_event`` is set. """
+        sleep(seconds, cancel_event)
+
+
+SYSTEM_CLOCK = SystemClock()
+
+
+def cancel_all():
+    """ Cancels every :class:`.HttSleeper` which is currently running, e.g. when
+    shutting down a service. Each of them is woken up immediately and raises a
+    :class:`.Cancelled` exception.
+    """
+    with _RUNNING_LOCK:
+        sleepers = list(_RUNNING)
+    for sleeper in sleepers:
+        sleeper.cancel()
+
 
 class HttSleeper(object):
     """
@@ -32,12 +100,68 @@ class HttSleeper(object):
                    TLS certificate, or a string, in which case it must be a path to a CA
                    bundle to use. If specified, this takes precedence over any value defined
                    in the session (which itself would be ``True``, by default).
-    :param polling_interval: how many seconds to sleep between requests.
+    :param polling_interval: how many seconds to sleep between requests, e.g. ``0.5``.
     :param max_retries: the maximum number of retries to make, after which
                         a StopIteration exception is raised.
     :param ignore_exceptions: a list of exceptions to ignore when polling
                               the endpoint.
-    :param loglevel: the loglevel to use. Defaults to `ERROR`.
+    :param loglevel: the lowest level of the messages this HttSleeper logs to the
+                     ``httsleep`` logger. Defaults to `ERROR`. Messages are only formatted
+                     if the logger is also enabled for their level; the logging
+                     configuration itself is left alone.
+    :param cancel_event: a :class:`threading.Event` used as a cancellation token. Setting
+                         it wakes the HttSleeper up and stops it. The same event can be shared
+                         between many HttSleepers to stop them all at once. If not specified,
+                         each HttSleeper gets its own event, which is set by :meth:`cancel`.
+    :param hedge_after: enables hedged requests. If a request hasn't been answered after
+                        this many seconds, a duplicate request is sent, and whichever response
+                        arrives first is used. This can also be a percentile of the latencies
+                        observed so far, e.g. ``'p95'``, in which case hedging kicks in once
+                        enough requests have been made.
+    :param hedge_urls: a list of alternate URLs (e.g. replicas) which duplicate requests are
+                       sent to, in turn. By default, the duplicate is sent to the same URL.
+    :param rate_limiter: a :class:`.RateLimiter`, consulted before each request is sent, which
+                         should be shared by all HttSleepers polling the same hosts. Defaults
+                         to the process-wide rate limiter, if one has been set with
+                         :func:`httsleep.ratelimit.set_default_rate_limiter`.
+    :param transport: the :class:`.Transport` used to send requests, e.g. a
+                      :class:`httsleep.transport.HTTP2Transport`. Defaults to sending them
+                      with ``session``.
+    :param clock: the clock used to tell the time and wait between requests, e.g. a
+                  :class:`httsleep.simulation.VirtualClock`. Defaults to real time.
+    :param auto_head: when polling a URL, send ``HEAD`` instead of ``GET`` requests if every
+                      condition can be evaluated without the response body (i.e. only uses
+                      ``status_code`` and ``headers``). The response returned then has
+                      **no body**, so e.g. ``.json()`` can't be called on it. If a ``HEAD``
+                      request gets an error status code (400 or above), the poll sends a
+                      ``GET`` request instead. httsleep keeps sending ``GET`` requests if
+                      the server rejects ``HEAD`` requests (405 or 501), or answers them
+                      with another status code than ``GET`` requests. Defaults to
+                      ``False``.
+    :param history_size: keep compact records of the last ``history_size`` attempts in
+                         :attr:`history`, which are also attached to the :class:`Alarm` or
+                         :class:`.RetriesExhausted` exception that ends polling. Responses
+                         themselves aren't kept. Defaults to ``None``, keeping no history.
+    :param max_body_size: the maximum size of response bodies, in bytes. Bodies are then
+                          streamed, and reading stops as soon as they grow larger than this,
+                          which bounds the memory used by each poll.
+    :param content_types: a list of accepted media types, e.g. ``['application/json']``.
+                          Bodies are then streamed, and responses with any other
+                          ``Content-Type`` are rejected before their body is read.
+    :param on_limit: what to do with a response which exceeds ``max_body_size`` or
+                     ``content_types``: ``'alarm'`` (the default) raises a
+                     :class:`.LimitExceeded` exception, which is an :class:`Alarm`, and
+                     ``'retry'`` treats the response as not ready yet.
+    :param profiler: a :class:`httsleep.profiling.PollProfiler`, which profiles each poll,
+                     attributing time to the transport, JSON decoding, ``jsonpath``
+                     conditions and callbacks. Only one HttSleeper can be profiled at a
+                     time, and requests sent by hedging threads aren't profiled.
+    :param webhook: a :class:`httsleep.webhook.WebhookReceiver`. The HttSleeper then gets a
+                    :attr:`callback_url`, which the API can call back when the state being
+                    waited for is reached. Payloads pushed to it are evaluated against the
+                    conditions as responses with status code ``200``, as soon as they
+                    arrive, so polling only serves as a fallback, and ``polling_interval``
+                    can be long. Webhooks wait in real time, whatever the ``clock``.
 
     ``url_or_request`` must be provided, along with at least one success condition (``until``).
 
@@ -47,9 +171,21 @@ class HttSleeper(object):
                  polling_interval=DEFAULT_POLLING_INTERVAL,
                  max_retries=DEFAULT_MAX_RETRIES,
                  ignore_exceptions=None,
-                 loglevel=logging.ERROR):
+                 loglevel=logging.ERROR,
+                 cancel_event=None,
+                 hedge_after=None, hedge_urls=None,
+                 rate_limiter=None,
+                 auto_head=False,
+                 clock=None,
+                 transport=None,
+                 history_size=None,
+                 max_body_size=None, content_types=None, on_limit=ON_LIMIT_ALARM,
+                 profiler=None,
+                 webhook=None):
         if not until:
             raise ValueError("No success conditions provided!")
+        if on_limit not in ON_LIMIT_CHOICES:
+            raise ValueError('on_limit must be one of {}'.format(ON_LIMIT_CHOICES))
         if isinstance(url_or_request, string_types):
             self.request = requests.Request(
                 method='GET', url=url_or_request, auth=auth, headers=headers)
@@ -72,35 +208,101 @@ class HttSleeper(object):
         self.kwargs = {}
         if verify is not None:
             self.kwargs['verify'] = verify
+        self.max_body_size = int(max_body_size) if max_body_size is not None else None
+        if content_types is not None:
+            self.content_types = [content_type.lower() for content_type in content_types]
+        else:
+            self.content_types = None
+        if self.max_body_size is not None or self.content_types is not None:
+            # Don't read bodies before the limits have been checked
+            self.kwargs['stream'] = True
+        self.on_limit = on_limit
+        # Only requests built from a URL are switched to HEAD: the method of a
+        # Request object is left as the caller chose it
+        self.auto_head = auto_head and isinstance(url_or_request, string_types)
         self.until = until
         self.alarms = alarms
-        self.polling_interval = int(polling_interval)
+        self.polling_interval = float(polling_interval)
         self.session = session
-        self.log = logging.getLogger()
-        self.log.setLevel(loglevel)
+        self.transport = transport if transport is not None else RequestsTransport(session)
+        self.cancel_event = cancel_event
+        self._owns_cancel_event = cancel_event is None
+        self._set_hedging(hedge_after, hedge_urls)
+        self.rate_limiter = rate_limiter
+        self.clock = clock or SYSTEM_CLOCK
+        self.history_size = history_size
+        self.profiler = profiler
+        self.webhook = webhook
+        self.loglevel = loglevel
+        self.log = log
+        self._init_run_state()
 
-    def _set_conditions(self, attribute, conditions):
-        value = []
-        if isinstance(conditions, dict):
-            conditions = [conditions]
-        if conditions:
-            for condition in conditions:
-                if not condition:
-                    # ignore empty dicts
-                    continue
-                for key in condition:
-                    if key not in VALID_CONDITIONS:
-                        raise ValueError(
-                            'Invalid key "{}" in condition: {}'.format(key, condition))
-                if condition.get('status_code'):
-                    condition['status_code'] = int(condition['status_code'])
-                # TODO: Add validation for jsonpath
-                value.append(condition)
-
-        if value == [] and attribute == 'until':
-            raise ValueError('No valid success conditions provided')
+    def _init_run_state(self):
+        """ Resets the state which changes while polling, so that copies of a
+        HttSleeper (see :meth:`.PollSpec.bind`) can run independently of each other.
+        """
+        if self._owns_cancel_event:
+            self.cancel_event = threading.Event()
+        self._head_rejected = False
+        self._body_cache = BodyCache()
+        self._latencies = collections.deque(maxlen=HEDGE_LATENCY_SAMPLES)
+        self._hedge_count = 0
+        self.history = PollHistory(self.history_size) if self.history_size else None
+        self._registration = None
+        self._race_stop = None
 
+    def _bind(self, url=None, params=None):
+        """ Returns a copy of this HttSleeper, polling ``url`` instead if given, with
+        fresh per-run state. The placeholders in the URL and the hedge URLs are filled
+        in from ``params``. Compiled conditions and other settings are shared, but the
+        request, its headers and the request kwargs are copied, so that changing them
+        doesn't affect other copies.
+        """
+        sleeper = copy.copy(self)
+        sleeper.kwargs = dict(self.kwargs)
+        sleeper.request = copy.copy(self.request)
+        sleeper.request.headers = copy.copy(self.request.headers)
+        sleeper.request.url = _format_url(url if url is not None else self.request.url,
+                                          params)
+        sleeper._hedge_requests = []
+        for hedge_request in self._hedge_requests:
+            request = copy.copy(sleeper.request)
+            request.url = _format_url(hedge_request.url, params)
+            sleeper._hedge_requests.append(request)
+        sleeper._init_run_state()
+        return sleeper
+
+    def _set_hedging(self, hedge_after, hedge_urls):
+        self.hedge_after = hedge_after
+        self._hedge_percentile = None
+        if isinstance(hedge_after, string_types):
+            if not hedge_after.startswith('p'):
+                raise ValueError('Invalid hedge_after percentile: {}'.format(hedge_after))
+            self._hedge_percentile = float(hedge_after[1:])
+            if not 0 < self._hedge_percentile < 100:
+                raise ValueError('Invalid hedge_after percentile: {}'.format(hedge_after))
+        elif hedge_after is not None:
+            self.hedge_after = float(hedge_after)
+        self._hedge_requests = []
+        for url in hedge_urls or []:
+            request = copy.copy(self.request)
+            request.url = url
+            self._hedge_requests.append(request)
+
+    def _set_conditions(self, attribute, conditions):
+        value = normalize_conditions(conditions, required=(attribute == 'until'))
         setattr(self, '_{}'.format(attribute), value)
+        setattr(self, '_{}_index'.format(attribute), ConditionIndex(value))
+        # Worked out once here, rather than on every request
+        self._bodyless = all(key in BODYLESS_CONDITIONS
+                             for condition in getattr(self, '_until', []) +
+                             getattr(self, '_alarms', [])
+                             for key in condition)
+
+    @property
+    def uses_head(self):
+        """ Whether requests are currently sent using the ``HEAD`` method. See ``auto_head``. """
+        return self.auto_head and not self._head_rejected and self._bodyless
 
     @property
     def alarms(self):
@@ -118,66 +320,499 @@ class HttSleeper(object):
     def until(self, value):
         return self._set_conditions('until', value)
 
+    @property
+    def callback_url(self):
+        """ The URL which payloads can be pushed to, if a ``webhook`` was given. It is
+        registered with the webhook receiver when first accessed, and unregistered when
+        :meth:`run` finishes.
+        """
+        if self.webhook is None:
+            return None
+        return self._register().url
+
+    def _register(self):
+        if self._registration is None:
+            self._registration = self.webhook.register()
+        return self._registration
+
+    def _close_registration(self):
+        if self._registration is not None:
+            self._registration.close()
+            self._registration = None
+
+    @property
+    def cancelled(self):
+        """ Whether this HttSleeper has been cancelled. """
+        return self.cancel_event.is_set()
+
+    def cancel(self):
+        """
+        Cancels polling. If the HttSleeper is currently waiting between two requests,
+        it is woken up immediately and :meth:`run` raises a :class:`.Cancelled` exception.
+        A request which is already in flight is allowed to complete, but its response
+        is discarded.
+
+        This method is thread-safe. It shouldn't be called from a signal handler, as it
+        takes locks which the interrupted thread may be holding: call it from another
+        thread started by the handler instead.
+        """
+        self.cancel_event.set()
+        race_stop = self._race_stop
+        if race_stop is not None:
+            race_stop.set()
+        registration = self._registration
+        if registration is not None:
+            registration.wake()
+
+    def prewarm(self, connections=1):
+        """
+        Opens keep-alive connections to the polled host ahead of time through the
+        transport (see :meth:`.RequestsTransport.prewarm`), so that the first polls don't
+        pay for DNS resolution and the TCP and TLS handshakes. A single HttSleeper only
+        needs one connection, but many HttSleepers which are about to poll the same host
+        share the connections opened by one of them.
+
+        :param connections: the number of connections to open.
+        :return: the number of connections which are open and idle.
+        """
+        return self.transport.prewarm(self.request.url, connections, self.kwargs.get('verify'))
+
+    def _log(self, level, message, *args):
+        """ Logs a message, which is only formatted if it is going to be emitted.
+        The URL being polled is attached to the record as ``url``.
+        """
+        if level >= self.loglevel and log.isEnabledFor(level):
+            log.log(level, message, *args, extra={'url': self.request.url})
+
+    def _raise_if_cancelled(self):
+        if self.cancelled:
+            raise Cancelled()
+
+    def _send_request(self, request):
+        rate_limiter = self.rate_limiter or get_default_rate_limiter()
+        if rate_limiter is not None:
+            rate_limiter.acquire(request.url, self.cancel_event)
+            self._raise_if_cancelled()
+        race_stop = self._race_stop
+        if race_stop is not None and race_stop.is_set():
+            # The race is over, so don't send another request (see :meth:`race`)
+            raise _RaceOver()
+        head_status_code = None
+        if self.uses_head:
+            response = _transport_send(self.transport, request, 'HEAD', self.kwargs)
+            if response.status_code < 400:
+                return response
+            # Servers may answer HEAD requests differently from GET requests (e.g. with
+            # 403 or 404), so errors are checked with a GET request
+            head_status_code = response.status_code
+            _close(response)
+        response = _transport_send(self.transport, request, None, self.kwargs)
+        if head_status_code is not None and (
+                head_status_code in HEAD_REJECTED_STATUS_CODES or
+                head_status_code != response.status_code):
+            self._log(logging.INFO, 'HEAD request failed with status code %s, '
+                      'falling back to GET', head_status_code)
+            self._head_rejected = True
+        if self.max_body_size is not None or self.content_types is not None:
+            enforce_limits(response, self.max_body_size, self.content_types)
+        return response
+
+    def _send(self):
+        if self.hedge_after is None:
+            return self._send_request(self.request)
+        return self._send_hedged()
+
+    def _hedge_delay(self):
+        if self._hedge_percentile is None:
+            return self.hedge_after
+        if len(self._latencies) < HEDGE_MIN_SAMPLES:
+            return None
+        latencies = sorted(self._latencies)
+        index = int(len(latencies) * self._hedge_percentile / 100.0)
+        return latencies[min(index, len(latencies) - 1)]
+
+    def _next_hedge_request(self):
+        if not self._hedge_requests:
+            return self.request
+        request = self._hedge_requests[self._hedge_count % len(self._hedge_requests)]
+        self._hedge_count += 1
+        return request
+
+    def _submit(self, request):
+        started = self.clock.time()
+
+        def record_latency(future):
+            if not future.cancelled() and future.exception() is None:
+                self._latencies.append(self.clock.time() - started)
+
+        future = _start_thread(self._send_request, request)
+        future.add_done_callback(record_latency)
+        return future
+
+    def _send_hedged(self):
+        """ Sends the request, and a duplicate of it if no response has arrived
+        after ``hedge_after`` seconds. The first response wins; the other request's
+        response is closed as soon as it arrives.
+
+        Each request is sent from a thread of its own, so that a request which lost
+        but hasn't returned yet doesn't hold up the requests of the next polls.
+        """
+        delay = self._hedge_delay()
+        pending = set([self._submit(self.request)])
+        errors = []
+        try:
+            while pending:
+                done, pending = wait(pending, timeout=delay, return_when=FIRST_COMPLETED)
+                if not done:
+                    self._log(logging.INFO, 'No response after %s seconds, hedging request',
+                              delay)
+                    pending.add(self._submit(self._next_hedge_request()))
+                    delay = None
+                    continue
+                for future in done:
+                    if future.exception() is None:
+                        return future.result()
+                    errors.append(future.exception())
+            raise errors[0]
+        finally:
+            for future in pending:
+                if not future.cancel():
+                    future.add_done_callback(_close_response)
+
+    def _check(self, response):
+        """ Raises :class:`Alarm` if the response meets an alarm condition, and
+        returns the success condition it meets, if any.
+        """
+        return check_conditions(response, self._until_index, self._alarms_index,
+                                self._body_cache)
+
+    def _record(self, started, latency, response, outcome, condition=None, body=True):
+        status_code = body_size = body_digest = None
+        if response is not None:
+            status_code = response.status_code
+            if body:
+                body_size = len(response.content or b'')
+                body_digest = self._body_cache.digest()
+        self.history.append(PollRecord(started, latency, status_code, body_size,
+                                       body_digest, outcome, condition))
+
+    def _history_records(self):
+        return self.history.records() if self.history is not None else None
+
+    def poll(self):
+        """
+        Polls the endpoint once. This is the building block of :meth:`run`, for
+        callers who schedule requests themselves.
+
+        Raises an :class:`Alarm` exception if the response meets an error condition,
+        and a :class:`.Cancelled` exception if the HttSleeper has been cancelled.
+        Exceptions listed in ``ignore_exceptions`` are logged and swallowed.
+
+        :return: :class:`requests.Response` object if the response meets a success
+                 condition, otherwise ``None``.
+        """
+        if self.profiler is None:
+            return self._poll()
+        self.profiler.enable()
+        try:
+            return self._poll()
+        finally:
+            self.profiler.disable()
+
+    def _poll(self):
+        self._raise_if_cancelled()
+        started = self.clock.time()
+        latency = None
+        try:
+            response = self._send()
+            latency = self.clock.time() - started
+            self._raise_if_cancelled()
+        except LimitExceeded as e:
+            if self.on_limit == ON_LIMIT_RETRY:
+                self._log(logging.INFO, 'Retrying, as %s', e.mesg)
+                if self.history is not None:
+                    self._record(started, latency, e.response, ERROR, body=False)
+                return None
+            if self.history is not None:
+                self._record(started, latency, e.response, ALARM, body=False)
+                e.history = self.history.records()
+            raise
+        except self.ignore_exceptions as e:
+            self._log(logging.INFO, 'Ignoring exception: %s', e)
+            if self.history is not None:
+                self._record(started, latency, None, ERROR)
+            return None
+        return self._evaluate(response, started, latency)
+
+    def _evaluate(self, response, started, latency):
+        """ Evaluates the conditions against a response, polled or pushed, and records
+        the outcome in :attr:`history`.
+
+        :raises Alarm: if the response meets an error condition.
+        :return: the response if it meets a success condition, otherwise ``None``.
+        """
+        try:
+            condition = self._check(response)
+        except Alarm as e:
+            if self.history is not None:
+                self._record(started, latency, response, ALARM, position(self._alarms, e.alarm))
+                e.history = self.history.records()
+            raise
+        except self.ignore_exceptions as e:
+            self._log(logging.INFO, 'Ignoring exception: %s', e)
+            if self.history is not None:
+                self._record(started, latency, response, ERROR)
+            return None
+        if self.history is not None:
+            if condition is None:
+                self._record(started, latency, response, PENDING)
+            else:
+                self._record(started, latency, response, SUCCESS,
+                             position(self._until, condition))
+        if condition is not None:
+            return response
+        return None
+
+    def _wait_for_push(self, seconds):
+        """ Waits for up to ``seconds`` for a payload to be pushed to the callback URL
+        which meets a success condition, and returns it.
+
+        :raises Alarm: if a pushed payload meets an error condition.
+        """
+        registration = self._register()
+        deadline = time.time() + seconds
+        while not self.cancelled:
+            remaining = deadline - time.time()
+            if remaining <= 0:
+                break
+            response = registration.get(min(remaining, WEBHOOK_WAKEUP_INTERVAL))
+            if response is None:
+                continue
+            response = self._evaluate_push(response)
+            if response is not None:
+                return response
+        return None
+
+    def _evaluate_push(self, response):
+        self._log(logging.INFO, 'Received a payload on %s', response.url)
+        # Pushed payloads are recorded like polls, without a latency
+        return self._evaluate(response, self.clock.time(), None)
+
+    def _wait(self):
+        """ Waits ``polling_interval`` seconds before the next poll. With a webhook,
+        returns a pushed payload which meets a success condition as soon as it arrives.
+        """
+        self._log(logging.INFO, 'Not ready, waiting %g seconds...', self.polling_interval)
+        if self.webhook is not None:
+            return self._wait_for_push(self.polling_interval)
+        self.clock.sleep(self.polling_interval, self.cancel_event)
+        return None
+
     def run(self):
         """
         Polls the endpoint until either:
 
         * a success condition in ``self.until`` is reached, in which case a
-          :class:`requests.Request` object is returned
+          :class:`requests.Request` object is returned. With a ``webhook``, this may be
+          a payload pushed to :attr:`callback_url`
         * an error condition in ``self.alarms`` is encountered, in which case an
           :class:`Alarm` exception is raised
-        * ``self.max_retries`` is reached, in which case a :class:`StopIteration` exception
-          is raised
+        * ``self.max_retries`` is reached, in which case a :class:`.RetriesExhausted`
+          exception (a :class:`StopIteration`) is raised
+        * the HttSleeper is cancelled, in which case a :class:`.Cancelled` exception is
+          raised
 
         :return: :class:`requests.Response` object.
         """
-        while True:
-            try:
-                response = self.session.send(self.session.prepare_request(self.request), **self.kwargs)
-                for condition in self.alarms:
-                    if self.meets_condition(response, condition):
-                        raise Alarm(response, condition)
-                if any([self.meets_condition(response, condition) for condition in self.until]):
+        retries_left = self.max_retries
+        with _RUNNING_LOCK:
+            _RUNNING.add(self)
+        try:
+            while True:
+                response = self.poll()
+                if response is not None:
                     return response
-            except self.ignore_exceptions as e:
-                self.log.info('Ignoring exception: {}'.format(e))
-            if self.max_retries is not None:
-                self.max_retries -= 1
-                if self.max_retries <= 0:
-                    raise StopIteration("Maximum number of retries reached")
-            self.log.info('Not ready, waiting {} seconds...'.format(self.polling_interval))
-            sleep(self.polling_interval)
+                if retries_left is not None:
+                    retries_left -= 1
+                    if retries_left <= 0:
+                        raise RetriesExhausted("Maximum number of retries reached",
+                                               self._history_records())
+                response = self._wait()
+                if response is not None:
+                    return response
+        finally:
+            with _RUNNING_LOCK:
+                _RUNNING.discard(self)
+            self._close_registration()
+
+    def _sleep_until(self, seconds, wake_event):
+        """ Sleeps for ``seconds``, waking up as soon as ``wake_event`` is set. The
+        ``cancel_event``, which may be shared and set directly, is checked every
+        ``CANCEL_CHECK_INTERVAL`` seconds.
+        """
+        deadline = self.clock.time() + seconds
+        while not wake_event.is_set() and not self.cancelled:
+            remaining = deadline - self.clock.time()
+            if remaining <= 0:
+                return
+            self.clock.sleep(min(remaining, CANCEL_CHECK_INTERVAL), wake_event)
+
+    def _race(self, budget, stop):
+        """ Polling loop used by :meth:`race`. Returns the first successful response,
+        or ``None`` once the shared ``budget`` is spent or ``stop`` is set, because
+        the race is over.
+        """
+        while not stop.is_set() and budget.take():
+            try:
+                response = self.poll()
+            except _RaceOver:
+                break
+            if response is not None:
+                return response
+            if budget.spent or stop.is_set():
+                break
+            self._log(logging.INFO, 'Not ready, waiting %g seconds...', self.polling_interval)
+            self._sleep_until(self.polling_interval, stop)
+        self._raise_if_cancelled()
+        return None
+
+    @staticmethod
+    def race(sleepers, max_requests=None):
+        """
+        Runs several HttSleepers concurrently, e.g. polling the same resource on
+        several replicas, and returns the first response which meets a success
+        condition of the HttSleeper that received it. All other HttSleepers then stop
+        polling. Their ``cancel_event`` isn't set, as it may be shared with other
+        HttSleepers. This method returns once they have all stopped: none of them sends
+        another request, but a request already in flight is allowed to complete, and
+        its response is discarded.
+
+        An :class:`Alarm` raised by any of the HttSleepers is raised immediately.
+
+        :param sleepers: a list of :class:`.HttSleeper` objects.
+        :param max_requests: the total number of requests which may be sent, by all
+                             HttSleepers together, after which a
+                             :class:`.RetriesExhausted` exception is raised. The
+                             HttSleepers' own ``max_retries``
+                             are ignored. If ``None``, there is no limit.
+        :return: :class:`requests.Response` object.
+        """
+        sleepers = list(sleepers)
+        if not sleepers:
+            raise ValueError('No HttSleepers provided')
+        budget = _RequestBudget(max_requests)
+        executor = ThreadPoolExecutor(max_workers=len(sleepers))
+        # Each HttSleeper has its own stop event, so that cancelling one of them
+        # doesn't stop the others
+        stops = [threading.Event() for _ in sleepers]
+        with _RUNNING_LOCK:
+            for sleeper, stop in zip(sleepers, stops):
+                sleeper._race_stop = stop
+                _RUNNING.add(sleeper)
+        try:
+            pending = set(executor.submit(sleeper._race, budget, stop)
+                          for sleeper, stop in zip(sleepers, stops))
+            cancelled = False
+            while pending:
+                done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                for future in done:
+                    if isinstance(future.exception(), Cancelled):
+                        cancelled = True
+                    elif future.exception() is not None:
+                        raise future.exception()
+                    elif future.result() is not None:
+                        return future.result()
+            if cancelled:
+                raise Cancelled()
+            raise RetriesExhausted("Maximum number of requests reached")
+        finally:
+            for stop in stops:
+                stop.set()
+            # The losers wake up as soon as their stop event is set
+            executor.shutdown(wait=True)
+            with _RUNNING_LOCK:
+                for sleeper in sleepers:
+                    sleeper._race_stop = None
+                    _RUNNING.discard(sleeper)
 
     @staticmethod
     def meets_condition(response, condition):
-        if condition.get('status_code') and response.status_code != condition['status_code']:
-            return False
-        if condition.get('json') and response.json() != condition['json']:
-            return False
-        if condition.get('text') and response.text != condition['text']:
-            return False
-        if condition.get('jsonpath'):
-            for jsonpath in condition['jsonpath']:
-                if isinstance(jsonpath['expression'], string_types):
-                    expression = jsonpath_rw.parse(jsonpath['expression'])
-                else:
-                    expression = jsonpath['expression']
-                value = jsonpath['value']
-                results = expression.find(response.json())
-                if not results:
-                    return False
-                elif len(results) == 1:
-                    if results[0].value != value:
-                        return False
-                else:
-                    if [result.value for result in results] != value:
-                        return False
-        if condition.get('callback'):
-            if condition['callback'](response) == True:
-                pass
-            else:
+        return CompiledCondition(condition).meets(response)
+
+
+class _RaceOver(Exception):
+    """ Raised in a HttSleeper which is about to send a request after the race it
+    takes part in is over.
+    """
+
+
+class _RequestBudget(object):
+    """ A thread-safe count of the requests which may still be sent. """
+    def __init__(self, max_requests):
+        self.remaining = max_requests
+        self._lock = threading.Lock()
+
+    @property
+    def spent(self):
+        return self.remaining is not None and self.remaining <= 0
+
+    def take(self):
+        if self.remaining is None:
+            return True
+        with self._lock:
+            if self.remaining <= 0:
                 return False
-        return True
+            self.remaining -= 1
+            return True
+
+
+def _format_url(url, params):
+    """ Fills in the placeholders of a URL template, if any ``params`` are given. """
+    if not params:
+        return url
+    try:
+        return url.format(**params)
+    except KeyError as e:
+        raise ValueError('No value provided for URL parameter {}'.format(e))
+
+
+def _transport_send(transport, request, method, kwargs):
+    # Requests are sent through this function, so that profiles can attribute time to
+    # the transport (see :class:`httsleep.profiling.PollProfiler`)
+    if method is None:
+        return transport.send(request, **kwargs)
+    return transport.send(request, method=method, **kwargs)
+
+
+def _start_thread(function, *args):
+    """ Calls ``function`` in a new daemon thread, and returns a
+    :class:`concurrent.futures.Future` of its result.
+    """
+    future = Future()
+
+    def target():
+        if not future.set_running_or_notify_cancel():
+            return
+        try:
+            future.set_result(function(*args))
+        except BaseException as e:
+            future.set_exception(e)
+
+    thread = threading.Thread(target=target)
+    thread.daemon = True
+    thread.start()
+    return future
+
+
+def _close(response):
+    # Responses from custom transports may have no ``raw`` to close
+    if getattr(response, 'raw', None) is not None:
+        response.close()
+
+
+def _close_response(future):
+    if not future.cancelled() and future.exception() is None:
+        _close(future.result())
 
 
 def httsleep(url_or_request, until=None, alarms=None,
@@ -185,7 +820,17 @@ def httsleep(url_or_request, until=None, alarms=None,
              polling_interval=DEFAULT_POLLING_INTERVAL,
              max_retries=DEFAULT_MAX_RETRIES,
              ignore_exceptions=None,
-             loglevel=logging.ERROR):
+             loglevel=logging.ERROR,
+             cancel_event=None,
+             hedge_after=None, hedge_urls=None,
+             rate_limiter=None,
+             auto_head=False,
+             clock=None,
+             transport=None,
+             history_size=None,
+             max_body_size=None, content_types=None, on_limit=ON_LIMIT_ALARM,
+             profiler=None,
+             webhook=None):
     """ Convenience wrapper for the :class:`.HttSleeper` class.
     Creates a HttSleeper object and automatically runs it.
 
@@ -197,5 +842,55 @@ def httsleep(url_or_request, until=None, alarms=None,
         polling_interval=polling_interval,
         max_retries=max_retries,
         ignore_exceptions=ignore_exceptions,
-        loglevel=loglevel
+        loglevel=loglevel,
+        cancel_event=cancel_event,
+        hedge_after=hedge_after, hedge_urls=hedge_urls,
+        rate_limiter=rate_limiter,
+        auto_head=auto_head,
+        clock=clock,
+        transport=transport,
+        history_size=history_size,
+        max_body_size=max_body_size, content_types=content_types, on_limit=on_limit,
+        profiler=profiler,
+        webhook=webhook
     ).run()
+
+
+def httsleep_any(urls_or_requests, until=None, alarms=None,
+                 auth=None, headers=None, session=DEFAULT_SESSION, verify=None,
+                 polling_interval=DEFAULT_POLLING_INTERVAL,
+                 max_requests=DEFAULT_MAX_RETRIES,
+                 ignore_exceptions=None,
+                 loglevel=logging.ERROR,
+                 rate_limiter=None,
+                 auto_head=False,
+                 transport=None,
+                 max_body_size=None, content_types=None, on_limit=ON_LIMIT_ALARM):
+    """ Polls several endpoints (e.g. replicas or regional endpoints) concurrently,
+    with the same success and error conditions, and returns the first response which
+    meets a success condition. See :meth:`.HttSleeper.race`.
+
+    :param urls_or_requests: a list of URLs and/or :class:`requests.Request` objects.
+    :param max_requests: the total number of requests which may be sent to all
+                         endpoints together, after which a :class:`.RetriesExhausted`
+                         exception is raised.
+
+    All other parameters are the same as for :class:`.HttSleeper`.
+
+    :return: :class:`requests.Response` object.
+    """
+    sleepers = [
+        HttSleeper(
+            url_or_request, until=until, alarms=alarms,
+            auth=auth, headers=headers, session=session, verify=verify,
+            polling_interval=polling_interval,
+            max_retries=None,
+            ignore_exceptions=ignore_exceptions,
+            loglevel=loglevel,
+            rate_limiter=rate_limiter,
+            auto_head=auto_head,
+            transport=transport,
+            max_body_size=max_body_size, content_types=content_types, on_limit=on_limit
+        ) for url_or_request in urls_or_requests
+    ]
+    return HttSleeper.race(sleepers, max_requests=max_requests)
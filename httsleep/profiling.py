@@ -0,0 +1,75 @@
+"""
+Profiling of polling, with :mod:`cProfile`.
+
+.. code-block:: python
+
+   from httsleep.profiling import PollProfiler
+
+   profiler = PollProfiler()
+   httsleep('http://myendpoint/jobs/1', until={'jsonpath': [...]}, profiler=profiler)
+   print(profiler.totals())
+   profiler.dump('poll.prof')  # e.g. for pstats or snakeviz
+"""
+import cProfile
+import pstats
+
+
+CATEGORIES = ['transport', 'json', 'jsonpath', 'callback']
+
+
+def _code_key(function):
+    """ Returns the key of a function in :class:`pstats.Stats`. """
+    code = function.__code__
+    return (code.co_filename, code.co_firstlineno, code.co_name)
+
+
+def _category_functions():
+    # imported lazily, as these modules may import this one
+    from .conditions import _call_callback, _decode_json, _find_jsonpath
+    from .main import _transport_send
+    return {
+        'transport': _transport_send,
+        'json': _decode_json,
+        'jsonpath': _find_jsonpath,
+        'callback': _call_callback,
+    }
+
+
+class PollProfiler(object):
+    """
+    Collects a profile of the polls made by the HttSleepers it is passed to (as
+    ``profiler``), and attributes their cumulative time to categories:
+
+    * ``transport``: sending requests and receiving responses
+    * ``json``: decoding response bodies as JSON
+    * ``jsonpath``: evaluating the expressions of ``jsonpath`` conditions
+    * ``callback``: calling the functions of ``callback`` conditions
+
+    The time spent waiting between polls isn't profiled.
+    """
+    def __init__(self):
+        self.profile = cProfile.Profile()
+
+    def enable(self):
+        self.profile.enable()
+
+    def disable(self):
+        self.profile.disable()
+
+    def stats(self):
+        """ Returns the profile as a :class:`pstats.Stats` object. """
+        return pstats.Stats(self.profile)
+
+    def totals(self):
+        """ Returns a dict mapping each category to its cumulative time, in seconds. """
+        self.profile.create_stats()
+        stats = self.profile.stats
+        totals = {}
+        for category, function in _category_functions().items():
+            entry = stats.get(_code_key(function))
+            totals[category] = entry[3] if entry is not None else 0.0
+        return totals
+
+    def dump(self, path):
+        """ Writes the profile to ``path``, in the format read by :mod:`pstats`. """
+        self.profile.dump_stats(path)
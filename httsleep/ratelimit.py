@@ -0,0 +1,125 @@
+"""
+Token-bucket rate limiting of requests, per host.
+"""
+import threading
+import time
+
+from ._compat import urlsplit
+
+
+_default_rate_limiter = None
+
+
+def set_default_rate_limiter(rate_limiter):
+    """ Sets a process-wide :class:`RateLimiter`, which is used by every HttSleeper
+    that hasn't been given a ``rate_limiter`` of its own. Pass ``None`` to disable it.
+    """
+    global _default_rate_limiter
+    _default_rate_limiter = rate_limiter
+
+
+def get_default_rate_limiter():
+    """ Returns the process-wide :class:`RateLimiter`, or ``None`` if none was set. """
+    return _default_rate_limiter
+
+
+class TokenBucket(object):
+    """
+    A thread-safe token bucket, refilled at ``rate`` tokens per second up to a
+    maximum of ``burst`` tokens.
+
+    Callers reserve a token and are told how long to wait until it's theirs, so
+    that requests are queued in order and smoothed out rather than dropped.
+    """
+    def __init__(self, rate, burst=1):
+        if rate <= 0:
+            raise ValueError('rate must be greater than zero')
+        if burst < 1:
+            raise ValueError('burst must be at least 1')
+        self.rate = float(rate)
+        self.burst = float(burst)
+        self._tokens = self.burst
+        self._updated = time.time()
+        self._lock = threading.Lock()
+
+    def reserve(self):
+        """ Takes a token, and returns the number of seconds to wait before using it. """
+        with self._lock:
+            now = time.time()
+            self._tokens = min(self.burst, self._tokens + (now - self._updated) * self.rate)
+            self._updated = now
+            self._tokens -= 1
+            if self._tokens >= 0:
+                return 0.0
+            return -self._tokens / self.rate
+
+
+class RateLimiter(object):
+    """
+    Limits the rate of requests sent to each host, using one :class:`TokenBucket`
+    per host. A single RateLimiter is meant to be shared by all HttSleepers in a
+    process, either by passing it as ``rate_limiter``, or by making it the default
+    with :func:`set_default_rate_limiter`.
+
+    :param rate: the number of requests per second allowed for each host.
+    :param burst: the number of requests which may be sent to a host at once, after
+                  it has been idle.
+    :param per_host: a dict mapping host names (e.g. ``'api.example.com:8443'``) to
+                     ``(rate, burst)`` tuples, overriding ``rate`` and ``burst``.
+    """
+    def __init__(self, rate, burst=1, per_host=None):
+        self.rate = rate
+        self.burst = burst
+        self.per_host = dict(per_host or {})
+        self._buckets = {}
+        self._stats = {}
+        self._lock = threading.Lock()
+
+    def _bucket(self, host):
+        with self._lock:
+            if host not in self._buckets:
+                rate, burst = self.per_host.get(host, (self.rate, self.burst))
+                self._buckets[host] = TokenBucket(rate, burst)
+                self._stats[host] = {'requests': 0, 'delayed': 0, 'waiting': 0,
+                                     'total_delay': 0.0, 'max_delay': 0.0}
+            return self._buckets[host], self._stats[host]
+
+    def acquire(self, url, cancel_event=None):
+        """
+        Blocks until a request may be sent to the host of ``url``. If a
+        ``cancel_event`` is given, the wait is cut short as soon as it is set.
+
+        :return: the number of seconds the request was queued for.
+        """
+        bucket, stats = self._bucket(urlsplit(url).netloc)
+        delay = bucket.reserve()
+        with self._lock:
+            stats['requests'] += 1
+            if delay > 0:
+                stats['delayed'] += 1
+                stats['waiting'] += 1
+                stats['total_delay'] += delay
+                stats['max_delay'] = max(stats['max_delay'], delay)
+        if delay > 0:
+            try:
+                if cancel_event is None:
+                    time.sleep(delay)
+                else:
+                    cancel_event.wait(delay)
+            finally:
+                with self._lock:
+                    stats['waiting'] -= 1
+        return delay
+
+    def metrics(self):
+        """
+        Returns a dict mapping each host to a dict of metrics about its queue:
+
+        * ``requests``: the number of requests sent to the host
+        * ``delayed``: how many of those had to wait
+        * ``waiting``: the number of requests currently waiting
+        * ``total_delay``: the total time, in seconds, that requests were queued for
+        * ``max_delay``: the longest time, in seconds, that a request was queued for
+        """
+        with self._lock:
+            return dict((host, dict(stats)) for host, stats in self._stats.items())
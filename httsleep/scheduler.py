@@ -0,0 +1,72 @@
+"""
+Polling many HttSleepers concurrently from a single scheduler.
+"""
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+import heapq
+import itertools
+import time
+
+from .exceptions import Cancelled, RetriesExhausted
+
+
+DEFAULT_MAX_WORKERS = 20
+
+
+def poll_many(sleepers, max_workers=DEFAULT_MAX_WORKERS):
+    """
+    Polls many HttSleepers concurrently. A single scheduler keeps track of when each
+    HttSleeper is next due, and hands due requests to a pool of ``max_workers``
+    threads, so no thread is tied up while a HttSleeper is waiting between requests.
+
+    This is a generator, which yields a ``(sleeper, response, exception)`` tuple as
+    soon as each HttSleeper has finished:
+
+    * if a success condition was met, ``response`` is the :class:`requests.Response`
+      and ``exception`` is ``None``
+    * otherwise ``response`` is ``None`` and ``exception`` is the :class:`.Alarm`,
+      :class:`.RetriesExhausted` (when ``max_retries`` was reached), :class:`.Cancelled`
+      or other exception which stopped the HttSleeper
+
+    :param sleepers: a list of :class:`.HttSleeper` objects.
+    :param max_workers: the maximum number of requests in flight at any one time.
+    """
+    counter = itertools.count()
+    due = []
+    retries_left = {}
+    for sleeper in sleepers:
+        heapq.heappush(due, (time.time(), next(counter), sleeper))
+        retries_left[sleeper] = sleeper.max_retries
+    in_flight = {}
+    executor = ThreadPoolExecutor(max_workers=max_workers)
+    try:
+        while due or in_flight:
+            now = time.time()
+            while due and due[0][0] <= now:
+                _, _, sleeper = heapq.heappop(due)
+                if sleeper.cancelled:
+                    yield sleeper, None, Cancelled()
+                    continue
+                in_flight[executor.submit(sleeper.poll)] = sleeper
+            timeout = max(due[0][0] - now, 0) if due else None
+            if not in_flight:
+                time.sleep(timeout)
+                continue
+            done, _ = wait(list(in_flight), timeout=timeout, return_when=FIRST_COMPLETED)
+            for future in done:
+                sleeper = in_flight.pop(future)
+                if future.exception() is not None:
+                    yield sleeper, None, future.exception()
+                elif future.result() is not None:
+                    yield sleeper, future.result(), None
+                elif retries_left[sleeper] is not None and retries_left[sleeper] <= 1:
+                    yield sleeper, None, RetriesExhausted("Maximum number of retries reached",
+                                                          sleeper._history_records())
+                else:
+                    if retries_left[sleeper] is not None:
+                        retries_left[sleeper] -= 1
+                    heapq.heappush(
+                        due, (time.time() + sleeper.polling_interval, next(counter), sleeper))
+    finally:
+        for future in in_flight:
+            future.cancel()
+        executor.shutdown(wait=False)
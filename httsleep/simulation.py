@@ -0,0 +1,260 @@
+"""
+Simulation of pollers in virtual time, for tuning polling policies offline.
+
+A :class:`Simulator` replays endpoint readiness traces against a fleet of
+HttSleepers, whose clocks are :class:`VirtualClock` objects: waiting takes no real
+time, so hours of polling are simulated in seconds. It reports how many requests
+were sent, and how long it took each poller to detect that its endpoint was ready.
+
+.. code-block:: python
+
+   from httsleep.simulation import Simulator, Trace
+
+   traces = [Trace.synthetic(ready_at=random.expovariate(1 / 600.0)) for _ in range(1000)]
+   reports = Simulator(traces).compare({
+       'every 5s': {'polling_interval': 5},
+       'every 30s': {'polling_interval': 30},
+   }, until={'json': {'status': 'OK'}})
+   for name, report in reports.items():
+       print(name, report.total_requests, report.latency_percentile(95))
+"""
+import bisect
+import json
+
+import requests
+
+from ._compat import text_type
+from .exceptions import Alarm
+from .main import HttSleeper
+from .ratelimit import get_default_rate_limiter
+
+
+class VirtualClock(object):
+    """
+    A clock whose time only moves forward when something sleeps, or when it is
+    advanced explicitly. See :class:`httsleep.main.SystemClock`.
+
+    :param start: the initial time, in seconds.
+    """
+    def __init__(self, start=0.0):
+        self.now = float(start)
+
+    def time(self):
+        return self.now
+
+    def advance(self, seconds):
+        self.now += seconds
+
+    def sleep(self, seconds, cancel_event=None):
+        if cancel_event is not None and cancel_event.is_set():
+            return
+        self.advance(seconds)
+
+
+class _HorizonReached(Exception):
+    pass
+
+
+class _BoundedClock(VirtualClock):
+    """ A :class:`VirtualClock` which stops a simulated poller, by raising
+    :class:`_HorizonReached`, when it would sleep past ``end_at``.
+    """
+    def __init__(self, end_at=None):
+        super(_BoundedClock, self).__init__()
+        self.end_at = end_at
+
+    def sleep(self, seconds, cancel_event=None):
+        if self.end_at is not None and self.now + seconds >= self.end_at:
+            self.now = max(self.now, float(self.end_at))
+            raise _HorizonReached()
+        super(_BoundedClock, self).sleep(seconds, cancel_event)
+
+
+class Trace(object):
+    """
+    The states an endpoint goes through over time.
+
+    :param states: a list of ``(start_time, status_code, body)`` tuples, e.g. recorded
+                   from a real endpoint. Each state lasts until the next one starts.
+                   ``body`` is either a string, or a value which is encoded as JSON.
+    :param ready_at: the time at which the endpoint became ready, against which
+                     detection latency is measured. Defaults to the start of the
+                     last state.
+    :param latency: how many seconds each request takes.
+    """
+    def __init__(self, states, ready_at=None, latency=0.0):
+        if not states:
+            raise ValueError('A trace needs at least one state')
+        self.states = sorted(states, key=lambda state: state[0])
+        self._start_times = [state[0] for state in self.states]
+        self.ready_at = ready_at if ready_at is not None else self.states[-1][0]
+        self.latency = latency
+
+    @classmethod
+    def synthetic(cls, ready_at, pending=(200, {'status': 'PENDING'}),
+                  ready=(200, {'status': 'OK'}), latency=0.0):
+        """ Creates a trace of an endpoint which is pending until ``ready_at``, and
+        ready from then on.
+        """
+        return cls([(0.0,) + tuple(pending), (ready_at,) + tuple(ready)],
+                   ready_at=ready_at, latency=latency)
+
+    def state_at(self, when):
+        """ Returns the ``(status_code, body)`` of the endpoint at time ``when``. """
+        index = max(bisect.bisect_right(self._start_times, when) - 1, 0)
+        return self.states[index][1:]
+
+
+class SimulatedSession(requests.Session):
+    """
+    A Requests session which, rather than sending requests, answers them from a
+    :class:`Trace` at the current time of a :class:`VirtualClock`.
+    """
+    def __init__(self, trace, clock):
+        super(SimulatedSession, self).__init__()
+        self.trace = trace
+        self.clock = clock
+        self.request_count = 0
+
+    def send(self, request, **kwargs):
+        self.request_count += 1
+        self.clock.advance(self.trace.latency)
+        status_code, body = self.trace.state_at(self.clock.time())
+        if not isinstance(body, (bytes, text_type)):
+            body = json.dumps(body)
+        if not isinstance(body, bytes):
+            body = body.encode('utf-8')
+        response = requests.Response()
+        response.status_code = status_code
+        response._content = body if request.method != 'HEAD' else b''
+        response.encoding = 'utf-8'
+        response.url = request.url
+        response.request = request
+        return response
+
+
+class SimulationResult(object):
+    """
+    The outcome of polling one trace.
+
+    * ``outcome``: ``'success'``, ``'alarm'``, ``'retries_exhausted'`` or
+      ``'undetected'`` (if the simulation's ``duration`` ran out first)
+    * ``requests``: the number of requests sent
+    * ``ready_at``: when the endpoint became ready
+    * ``finished_at``: when the poller stopped
+    * ``latency``: for successes, how long after ``ready_at`` the poller noticed
+    """
+    __slots__ = ('outcome', 'requests', 'ready_at', 'finished_at')
+
+    def __init__(self, outcome, requests, ready_at, finished_at):
+        self.outcome = outcome
+        self.requests = requests
+        self.ready_at = ready_at
+        self.finished_at = finished_at
+
+    @property
+    def latency(self):
+        if self.outcome != 'success':
+            return None
+        return max(self.finished_at - self.ready_at, 0.0)
+
+
+class SimulationReport(object):
+    """ The results of a simulation, along with aggregate statistics. """
+    def __init__(self, results):
+        self.results = results
+
+    @property
+    def total_requests(self):
+        return sum(result.requests for result in self.results)
+
+    def count(self, outcome):
+        """ Returns the number of pollers which finished with ``outcome``. """
+        return sum(1 for result in self.results if result.outcome == outcome)
+
+    @property
+    def latencies(self):
+        return sorted(result.latency for result in self.results if result.latency is not None)
+
+    @property
+    def mean_latency(self):
+        latencies = self.latencies
+        return sum(latencies) / len(latencies) if latencies else None
+
+    def latency_percentile(self, percentile):
+        """ Returns the given percentile (0-100) of the detection latencies. """
+        latencies = self.latencies
+        if not latencies:
+            return None
+        index = int(len(latencies) * percentile / 100.0)
+        return latencies[min(index, len(latencies) - 1)]
+
+
+class Simulator(object):
+    """
+    Replays traces against pollers in virtual time.
+
+    :param traces: a list of :class:`Trace` objects, one per simulated poller.
+    :param url: the URL the pollers poll. It doesn't matter, except to conditions
+                which inspect it.
+    """
+    def __init__(self, traces, url='http://simulated.invalid/'):
+        self.traces = list(traces)
+        self.url = url
+
+    def run(self, until=None, alarms=None, duration=None, **kwargs):
+        """
+        Polls every trace with a :class:`.HttSleeper`, created with the given
+        conditions and keyword arguments (e.g. ``polling_interval`` and
+        ``max_retries``). Hedging, webhooks and rate limiting aren't supported, as they
+        wait in real time.
+
+        :param duration: how many seconds of virtual time each poller may run for.
+                         Pollers which are still waiting then are reported as
+                         ``'undetected'``. Required if ``max_retries`` is ``None``.
+        :return: a :class:`SimulationReport`.
+        :raises ValueError: if a poller might never stop, or uses a feature which waits
+                            in real time.
+        """
+        for name in ('hedge_after', 'webhook', 'rate_limiter'):
+            if kwargs.get(name) is not None:
+                raise ValueError('{} is not supported in simulations'.format(name))
+        if get_default_rate_limiter() is not None:
+            raise ValueError('The default rate limiter is not supported in simulations')
+        results = []
+        for trace in self.traces:
+            clock = _BoundedClock(duration)
+            session = SimulatedSession(trace, clock)
+            sleeper = HttSleeper(self.url, until=until, alarms=alarms,
+                                 session=session, clock=clock, **kwargs)
+            if sleeper.max_retries is None:
+                if duration is None:
+                    raise ValueError('Give a duration or max_retries, or the simulation '
+                                     'may never end')
+                if sleeper.polling_interval <= 0 and trace.latency <= 0:
+                    raise ValueError('Virtual time would never advance: give a '
+                                     'polling_interval, a trace latency or max_retries')
+            try:
+                sleeper.run()
+                outcome = 'success'
+            except Alarm:
+                outcome = 'alarm'
+            except StopIteration:
+                outcome = 'retries_exhausted'
+            except _HorizonReached:
+                outcome = 'undetected'
+            results.append(SimulationResult(outcome, session.request_count,
+                                            trace.ready_at, clock.time()))
+        return SimulationReport(results)
+
+    def compare(self, policies, until=None, alarms=None, duration=None):
+        """
+        Runs the simulation once per policy, as with :meth:`run`.
+
+        :param policies: a dict mapping policy names to dicts of keyword arguments
+                         for :class:`.HttSleeper`.
+        :return: a dict mapping policy names to :class:`SimulationReport` objects.
+        """
+        return dict((name, self.run(until=until, alarms=alarms, duration=duration,
+                                    **kwargs))
+                    for name, kwargs in policies.items())
@@ -0,0 +1,91 @@
+"""
+Reusable polling templates.
+"""
+import logging
+
+from .limits import ON_LIMIT_ALARM
+from .main import (DEFAULT_MAX_RETRIES, DEFAULT_POLLING_INTERVAL, DEFAULT_SESSION,
+                   HttSleeper)
+
+
+class PollSpec(object):
+    """
+    An immutable template for polling, which validates and compiles its request,
+    conditions and settings once. Each call to :meth:`bind` or :meth:`run` then
+    cheaply creates an independent :class:`.HttSleeper` from it.
+
+    A PollSpec can be shared between threads.
+
+    It takes the same parameters as :class:`.HttSleeper`. The URL may be a template
+    containing ``{placeholders}``, which are filled in by :meth:`bind`:
+
+    .. code-block:: python
+
+       spec = PollSpec('http://myendpoint/jobs/{job_id}', until={'status_code': 200})
+       response = spec.run(job_id=1)
+    """
+    __slots__ = ('_prototype',)
+
+    def __init__(self, url_or_request, until=None, alarms=None,
+                 auth=None, headers=None, session=DEFAULT_SESSION, verify=None,
+                 polling_interval=DEFAULT_POLLING_INTERVAL,
+                 max_retries=DEFAULT_MAX_RETRIES,
+                 ignore_exceptions=None,
+                 loglevel=logging.ERROR,
+                 cancel_event=None,
+                 hedge_after=None, hedge_urls=None,
+                 rate_limiter=None,
+                 auto_head=False,
+                 clock=None,
+                 transport=None,
+                 history_size=None,
+                 max_body_size=None, content_types=None, on_limit=ON_LIMIT_ALARM,
+                 profiler=None,
+                 webhook=None):
+        prototype = HttSleeper(
+            url_or_request, until=until, alarms=alarms,
+            auth=auth, headers=headers, session=session, verify=verify,
+            polling_interval=polling_interval,
+            max_retries=max_retries,
+            ignore_exceptions=ignore_exceptions,
+            loglevel=loglevel,
+            cancel_event=cancel_event,
+            hedge_after=hedge_after, hedge_urls=hedge_urls,
+            rate_limiter=rate_limiter,
+            auto_head=auto_head,
+            clock=clock,
+            transport=transport,
+            history_size=history_size,
+            max_body_size=max_body_size, content_types=content_types, on_limit=on_limit,
+            profiler=profiler,
+            webhook=webhook
+        )
+        object.__setattr__(self, '_prototype', prototype)
+
+    def __setattr__(self, name, value):
+        raise AttributeError('PollSpec objects are immutable')
+
+    @property
+    def url(self):
+        """ The URL, or URL template, to be polled. """
+        return self._prototype.request.url
+
+    def bind(self, url=None, **params):
+        """
+        Creates a :class:`.HttSleeper` from this template.
+
+        :param url: the URL (or URL template) to poll, instead of the template's.
+        :param params: values for the placeholders in the URL template, and in the
+                       ``hedge_urls``.
+        :return: :class:`.HttSleeper` object.
+        """
+        return self._prototype._bind(url, params)
+
+    def run(self, url=None, **params):
+        """
+        Creates a :class:`.HttSleeper` from this template with :meth:`bind`, and
+        runs it.
+
+        :return: :class:`requests.Response` object.
+        """
+        return self.bind(url, **params).run()
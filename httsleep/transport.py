@@ -0,0 +1,267 @@
+"""
+Transports, which send the requests of HttSleepers and other pollers.
+
+A transport takes a :class:`requests.Request` and returns a
+:class:`requests.Response`, so that conditions are evaluated the same way, however
+the request was sent.
+"""
+import requests
+from requests.structures import CaseInsensitiveDict
+from requests.utils import get_encoding_from_headers, select_proxy
+
+from .dns import DNSCachingAdapter
+
+
+class Transport(object):
+    """ The interface of all transports. """
+    def send(self, request, method=None, **kwargs):
+        """
+        Sends a request.
+
+        :param request: a :class:`requests.Request` object.
+        :param method: the HTTP method to use instead of the request's, if any.
+        :param kwargs: keyword arguments for :meth:`requests.Session.send`, e.g. ``verify``,
+                       or ``stream``, to read the response body lazily.
+        :return: :class:`requests.Response` object.
+        """
+        raise NotImplementedError
+
+    def prewarm(self, url, connections=1, verify=None):
+        """
+        Opens keep-alive connections to the host of ``url`` ahead of time, so that the
+        first requests to it don't wait for DNS resolution and the TCP and TLS
+        handshakes. Transports which can't do so do nothing.
+
+        :param connections: the number of connections to open.
+        :param verify: the ``verify`` setting of the requests which will use them.
+        :return: the number of connections which are open and idle.
+        """
+        return 0
+
+    def close(self):
+        """ Releases the transport's connections. """
+
+
+class RequestsTransport(Transport):
+    """
+    The default transport, which sends requests through a Requests session, over
+    HTTP/1.1.
+
+    :param session: a Requests session. Defaults to a new session.
+    :param dns_cache: a :class:`.DNSCache`. If given, a :class:`.DNSCachingAdapter` using
+                      it is mounted on the session for ``http://`` and ``https://`` URLs.
+    """
+    def __init__(self, session=None, dns_cache=None):
+        self.session = session if session is not None else requests.Session()
+        if dns_cache is not None:
+            adapter = DNSCachingAdapter(dns_cache)
+            self.session.mount('http://', adapter)
+            self.session.mount('https://', adapter)
+
+    def send(self, request, method=None, **kwargs):
+        prepared_request = self.session.prepare_request(request)
+        if method is not None:
+            prepared_request.method = method
+        return self.session.send(prepared_request, **kwargs)
+
+    def _connection_pool(self, url, verify):
+        """ Returns the urllib3 connection pool which requests to ``url`` will use,
+        or ``None`` if they go through a proxy.
+        """
+        prepared_request = self.session.prepare_request(requests.Request(method='GET', url=url))
+        proxies = self.session.rebuild_proxies(prepared_request, self.session.proxies)
+        if select_proxy(url, proxies):
+            return None
+        adapter = self.session.get_adapter(url)
+        if hasattr(adapter, 'get_connection_with_tls_context'):
+            return adapter.get_connection_with_tls_context(
+                prepared_request, verify, cert=self.session.cert)
+        return adapter.get_connection(url)
+
+    def prewarm(self, url, connections=1, verify=None):
+        """
+        Opens keep-alive connections to the host of ``url`` ahead of time. At most as
+        many connections as the session's adapter pools per host (10 by default) are
+        kept. Connections through a proxy aren't pre-warmed.
+
+        :param connections: the number of connections to open.
+        :param verify: the ``verify`` setting of the requests which will use them.
+                       Defaults to the session's.
+        :return: the number of connections which are open and idle.
+        """
+        pool = self._connection_pool(url, verify if verify is not None else self.session.verify)
+        if pool is None:
+            return 0
+        opened = []
+        try:
+            for _ in range(min(connections, pool.pool.maxsize)):
+                conn = pool._get_conn()
+                if conn.sock is None:
+                    conn.connect()
+                opened.append(conn)
+        finally:
+            for conn in opened:
+                pool._put_conn(conn)
+        return len(opened)
+
+    def close(self):
+        self.session.close()
+
+
+class HTTP2Transport(Transport):
+    """
+    A transport which multiplexes requests to each host over a few HTTP/2
+    connections, rather than using one connection per request in flight. It is
+    thread-safe, so a single HTTP2Transport should be shared by all pollers.
+
+    Requires `httpx <https://www.python-httpx.org/>`_ with HTTP/2 support, which can be
+    installed with ``pip install httsleep[http2]``.
+
+    :param session: a Requests session, whose headers, cookies and auth are applied to
+                    each request before it is sent. Defaults to a new session.
+    :param verify: whether to verify the server's TLS certificate, or the path to a CA
+                   bundle. Unlike with :class:`RequestsTransport`, this can't be changed
+                   per request.
+    :param max_connections: the maximum number of connections to open, in total.
+    :param http1: whether to fall back to HTTP/1.1 for servers which don't support
+                  HTTP/2. If ``False``, HTTP/2 is used even without TLS ("prior
+                  knowledge").
+    :param timeout: the timeout for each request, in seconds.
+    """
+    def __init__(self, session=None, verify=True, max_connections=10, http1=True,
+                 timeout=None):
+        try:
+            import httpx
+        except ImportError:
+            raise ImportError('HTTP2Transport requires httpx: pip install httsleep[http2]')
+        self.session = session if session is not None else requests.Session()
+        self.verify = verify
+        self.client = httpx.Client(
+            http1=http1, http2=True, verify=verify, timeout=timeout,
+            limits=httpx.Limits(max_connections=max_connections),
+        )
+
+    def send(self, request, method=None, verify=None, stream=False, timeout=None,
+             allow_redirects=True, cert=None, proxies=None):
+        """
+        Sends a request. The keyword arguments are those of
+        :meth:`requests.Session.send`. ``verify``, ``cert`` and ``proxies`` can't be
+        changed per request, so a :class:`ValueError` is raised if they differ from the
+        transport's. Errors are raised as the equivalent
+        :mod:`requests.exceptions`, e.g. :class:`requests.exceptions.ConnectionError`.
+        """
+        if verify is not None and verify != self.verify:
+            raise ValueError('HTTP2Transport: verify must be set on the transport')
+        if cert is not None:
+            raise ValueError('HTTP2Transport: client certificates are not supported')
+        if proxies:
+            raise ValueError('HTTP2Transport: proxies are not supported')
+        prepared_request = self.session.prepare_request(request)
+        if method is not None:
+            prepared_request.method = method
+        build_kwargs = {}
+        if timeout is not None:
+            build_kwargs['timeout'] = _to_httpx_timeout(timeout)
+        try:
+            response = self.client.send(
+                self.client.build_request(
+                    prepared_request.method, prepared_request.url,
+                    headers=dict(prepared_request.headers), content=prepared_request.body,
+                    **build_kwargs),
+                stream=stream, follow_redirects=allow_redirects)
+        except _HTTPX_ERRORS as e:
+            raise _to_requests_exception(e, prepared_request)
+        return self._to_requests_response(prepared_request, response, stream)
+
+    @staticmethod
+    def _to_requests_response(prepared_request, response, stream=False):
+        converted = requests.Response()
+        converted.status_code = response.status_code
+        converted.reason = response.reason_phrase
+        converted.headers = CaseInsensitiveDict(response.headers.items())
+        converted.encoding = get_encoding_from_headers(converted.headers)
+        if stream:
+            # requests reads the body from ``raw`` in chunks, when it is first accessed
+            converted.raw = _StreamReader(response, prepared_request)
+        else:
+            converted._content = response.content
+            converted._content_consumed = True
+            converted.raw = response
+            converted.elapsed = response.elapsed
+        converted.url = str(response.url)
+        converted.request = prepared_request
+        return converted
+
+    def close(self):
+        self.client.close()
+
+
+def _httpx_errors():
+    try:
+        import httpx
+    except ImportError:
+        return ()
+    return (httpx.HTTPError, httpx.InvalidURL)
+
+
+_HTTPX_ERRORS = _httpx_errors()
+
+
+def _to_httpx_timeout(timeout):
+    """ Converts a Requests timeout, which is either a number of seconds or a
+    ``(connect, read)`` tuple, to a :class:`httpx.Timeout`.
+    """
+    import httpx
+    if isinstance(timeout, tuple):
+        connect, read = timeout
+        return httpx.Timeout(read, connect=connect)
+    return httpx.Timeout(timeout)
+
+
+def _to_requests_exception(error, prepared_request):
+    """ Returns the :mod:`requests.exceptions` equivalent of an httpx exception. """
+    import httpx
+    exceptions = requests.exceptions
+    # Subclasses come before their base classes
+    for httpx_class, requests_class in [
+            (httpx.ConnectTimeout, exceptions.ConnectTimeout),
+            (httpx.ReadTimeout, exceptions.ReadTimeout),
+            (httpx.TimeoutException, exceptions.Timeout),
+            (httpx.ProxyError, exceptions.ProxyError),
+            (httpx.UnsupportedProtocol, exceptions.InvalidSchema),
+            (httpx.TransportError, exceptions.ConnectionError),
+            (httpx.TooManyRedirects, exceptions.TooManyRedirects),
+            (httpx.DecodingError, exceptions.ContentDecodingError),
+            (httpx.InvalidURL, exceptions.InvalidURL)]:
+        if isinstance(error, httpx_class):
+            return requests_class(error, request=prepared_request)
+    return exceptions.RequestException(error, request=prepared_request)
+
+
+class _StreamReader(object):
+    """ Exposes the decoded body of a streamed httpx response as a file-like object,
+    as the ``raw`` attribute of a :class:`requests.Response`.
+    """
+    def __init__(self, response, prepared_request=None):
+        self.response = response
+        self.prepared_request = prepared_request
+        self._chunks = response.iter_bytes()
+        self._buffer = b''
+
+    def read(self, amt=None):
+        while amt is None or len(self._buffer) < amt:
+            try:
+                self._buffer += next(self._chunks)
+            except StopIteration:
+                self.response.close()
+                break
+            except _HTTPX_ERRORS as e:
+                self.response.close()
+                raise _to_requests_exception(e, self.prepared_request)
+        if amt is None:
+            amt = len(self._buffer)
+        data, self._buffer = self._buffer[:amt], self._buffer[amt:]
+        return data
+
+    def close(self):
+        self.response.close()
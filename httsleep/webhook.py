@@ -0,0 +1,195 @@
+"""
+A small embedded HTTP listener, which receives the callbacks that some APIs send when a
+job has finished, so that HttSleepers don't have to poll for it.
+
+.. code-block:: python
+
+   from httsleep.webhook import WebhookReceiver
+
+   receiver = WebhookReceiver(port=8080, public_url='http://myhost:8080')
+   sleeper = HttSleeper('http://myendpoint/jobs/1', until={'json': {'status': 'OK'}},
+                        webhook=receiver, polling_interval=300)
+   requests.post('http://myendpoint/jobs', json={'callback_url': sleeper.callback_url})
+   response = sleeper.run()
+"""
+import threading
+import uuid
+
+import requests
+
+from ._compat import BaseHTTPRequestHandler, HTTPServer, ThreadingMixIn, queue, urlsplit
+
+
+DEFAULT_MAX_PAYLOAD_SIZE = 1024 * 1024 # in bytes
+# Number of payloads kept for each callback URL until its HttSleeper reads them
+MAX_PENDING_PAYLOADS = 10
+
+
+def make_pushed_response(body, headers, url):
+    """ Wraps a pushed payload in a :class:`requests.Response` with status code 200, so
+    that conditions can be evaluated against it. The headers of the callback request
+    become the headers of the response.
+    """
+    response = requests.Response()
+    response.status_code = 200
+    response._content = body
+    response.headers.update(headers)
+    response.encoding = requests.utils.get_encoding_from_headers(response.headers)
+    response.url = url
+    return response
+
+
+class Registration(object):
+    """
+    A callback URL registered with a :class:`WebhookReceiver`, and the payloads pushed
+    to it which haven't been read yet.
+    """
+    def __init__(self, receiver, token, url):
+        self.receiver = receiver
+        self.token = token
+        self.url = url
+        self._payloads = queue.Queue(MAX_PENDING_PAYLOADS)
+        self.on_push = None
+
+    def push(self, response):
+        """ Queues a pushed payload. Returns ``False`` if too many are already queued. """
+        try:
+            self._payloads.put_nowait(response)
+        except queue.Full:
+            return False
+        self._notify()
+        return True
+
+    def get(self, timeout):
+        """ Returns the next pushed payload, waiting for at most ``timeout`` seconds.
+        Returns ``None`` if none arrived, or if :meth:`wake` was called.
+        """
+        try:
+            return self._payloads.get(timeout=timeout)
+        except queue.Empty:
+            return None
+
+    def get_nowait(self):
+        """ Returns the next pushed payload, or ``None`` if there is none (or if
+        :meth:`wake` was called), without waiting. Those who can't block in :meth:`get`
+        (e.g. coroutines) can set :attr:`on_push` to a function, which is called from
+        the receiver's thread whenever a payload is pushed or :meth:`wake` is called.
+        """
+        try:
+            return self._payloads.get_nowait()
+        except queue.Empty:
+            return None
+
+    def wake(self):
+        """ Wakes up whoever is waiting in :meth:`get`. """
+        try:
+            self._payloads.put_nowait(None)
+        except queue.Full:
+            pass
+        self._notify()
+
+    def _notify(self):
+        on_push = self.on_push
+        if on_push is not None:
+            on_push()
+
+    def close(self):
+        self.receiver.unregister(self)
+
+
+class _Server(ThreadingMixIn, HTTPServer):
+    daemon_threads = True
+
+
+class _Handler(BaseHTTPRequestHandler):
+    def _receive(self):
+        receiver = self.server.receiver
+        token = urlsplit(self.path).path.strip('/')
+        registration = receiver.registrations.get(token)
+        if registration is None:
+            return self._reply(404)
+        if self.headers.get('Content-Length') is None:
+            return self._reply(411)
+        try:
+            length = int(self.headers['Content-Length'])
+        except ValueError:
+            return self._reply(400)
+        if length < 0:
+            return self._reply(400)
+        if length > receiver.max_payload_size:
+            return self._reply(413)
+        body = self.rfile.read(length)
+        response = make_pushed_response(body, dict(self.headers.items()), registration.url)
+        self._reply(204 if registration.push(response) else 429)
+
+    do_POST = do_PUT = _receive
+
+    def _reply(self, status_code):
+        self.send_response(status_code)
+        self.send_header('Content-Length', '0')
+        self.end_headers()
+
+    def log_message(self, format, *args):
+        pass
+
+
+class WebhookReceiver(object):
+    """
+    An embedded HTTP server, which hands out callback URLs to HttSleepers (see the
+    ``webhook`` parameter of :class:`.HttSleeper`) and passes the payloads ``POST``-ed or
+    ``PUT`` to them on. It runs in a background thread, from when it is created until
+    :meth:`close` is called. A single receiver should be shared by all HttSleepers.
+
+    Each callback URL contains a random token, so it can't be guessed.
+
+    :param host: the address to listen on. Defaults to the loopback interface.
+    :param port: the port to listen on. Defaults to a free port.
+    :param public_url: the base URL under which the listener is reachable by the API
+                       calling it back, e.g. behind a proxy. Defaults to
+                       ``http://<host>:<port>``.
+    :param max_payload_size: the maximum size of a payload, in bytes. Larger payloads
+                             are rejected with status code 413.
+    """
+    def __init__(self, host='127.0.0.1', port=0, public_url=None,
+                 max_payload_size=DEFAULT_MAX_PAYLOAD_SIZE):
+        self.max_payload_size = max_payload_size
+        self.registrations = {}
+        self._lock = threading.Lock()
+        self._server = _Server((host, port), _Handler)
+        self._server.receiver = self
+        self.port = self._server.server_address[1]
+        if public_url is None:
+            public_url = 'http://{}:{}'.format(host, self.port)
+        self.public_url = public_url.rstrip('/')
+        thread = threading.Thread(target=self._server.serve_forever)
+        thread.daemon = True
+        thread.start()
+
+    def register(self):
+        """ Creates a new callback URL.
+
+        :return: a :class:`Registration` object.
+        """
+        token = uuid.uuid4().hex
+        registration = Registration(self, token, '{}/{}'.format(self.public_url, token))
+        with self._lock:
+            self.registrations[token] = registration
+        return registration
+
+    def unregister(self, registration):
+        """ Removes a callback URL. Payloads pushed to it are then rejected with status
+        code 404.
+        """
+        with self._lock:
+            self.registrations.pop(registration.token, None)
+
+    def close(self):
+        """ Stops listening. """
+        self._server.shutdown()
+        self._server.server_close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
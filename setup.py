@@ -27,7 +27,13 @@ def setup_package():
           zip_safe=False,
           include_package_data=True,
           setup_requires=['setuptools_scm'],
-          install_requires=['requests', 'jsonpath-rw'],
+          entry_points={
+              'console_scripts': ['httsleep = httsleep.cli:run'],
+          },
+          install_requires=['requests', 'jsonpath-rw', 'futures; python_version < "3.2"'],
+          extras_require={
+              'http2': ['httpx[http2]'],
+          },
           use_scm_version=True)
 
 
@@ -0,0 +1,134 @@
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+import threading
+import time
+
+import httpretty
+import mock
+import pytest
+import requests
+
+from httsleep.aio import AsyncHttSleeper, _CancelWatcher
+from httsleep.exceptions import Cancelled, MaxRetriesExceeded
+from httsleep.webhook import WebhookReceiver
+
+URL = 'http://example.com'
+
+
+@httpretty.activate
+def test_run_success():
+    httpretty.register_uri(httpretty.GET, URL, body='<html></html>', status=200)
+    resp = asyncio.run(AsyncHttSleeper(URL, {'status_code': 200}).run())
+    assert resp.status_code == 200
+
+
+@httpretty.activate
+def test_run_max_retries():
+    httpretty.register_uri(httpretty.GET, URL, body='Internal Server Error', status=500)
+    httsleep = AsyncHttSleeper(URL, {'status_code': 200}, max_retries=2, polling_interval=0)
+    with pytest.raises(MaxRetriesExceeded):
+        asyncio.run(httsleep.run())
+
+
+@httpretty.activate
+def test_cancel_wakes_up_sleep():
+    httpretty.register_uri(httpretty.GET, URL, body='Internal Server Error', status=500)
+    httsleep = AsyncHttSleeper(URL, {'status_code': 200}, polling_interval=60)
+
+    async def cancel_later():
+        await asyncio.sleep(0.1)
+        httsleep.cancel()
+
+    async def main():
+        await asyncio.gather(httsleep.run(), cancel_later())
+
+    with pytest.raises(Cancelled):
+        asyncio.run(asyncio.wait_for(main(), 5))
+
+
+@httpretty.activate
+def test_shared_cancel_event_wakes_up_sleep():
+    httpretty.register_uri(httpretty.GET, URL, body='Internal Server Error', status=500)
+    cancel_event = threading.Event()
+    httsleep = AsyncHttSleeper(URL, {'status_code': 200}, polling_interval=60,
+                               cancel_event=cancel_event)
+    timer = threading.Timer(0.1, cancel_event.set)
+    timer.start()
+    started = time.time()
+    with pytest.raises(Cancelled):
+        asyncio.run(asyncio.wait_for(httsleep.run(), 5))
+    timer.join()
+    assert time.time() - started < 1
+
+
+@httpretty.activate
+def test_shared_cancel_event_watched_once():
+    """Should watch a shared cancel_event from a single thread, however many sleep on it"""
+    httpretty.register_uri(httpretty.GET, URL, body='Internal Server Error', status=500)
+    cancel_event = threading.Event()
+    sleepers = [AsyncHttSleeper(URL, {'status_code': 200}, polling_interval=60,
+                                cancel_event=cancel_event) for _ in range(20)]
+
+    async def main():
+        tasks = [asyncio.ensure_future(sleeper.run()) for sleeper in sleepers]
+        while sum(len(watcher.waiters) for watcher in _CancelWatcher._watchers.values()) < 20:
+            await asyncio.sleep(0.01)
+        assert list(_CancelWatcher._watchers) == [cancel_event]
+        cancel_event.set()
+        return await asyncio.gather(*tasks, return_exceptions=True)
+
+    results = asyncio.run(asyncio.wait_for(main(), 5))
+    assert all(isinstance(result, Cancelled) for result in results)
+    assert _CancelWatcher._watchers == {}
+
+
+def test_webhook():
+    pending = requests.Response()
+    pending.status_code = 202
+    pending._content = b'{}'
+    transport = mock.Mock()
+    transport.send.return_value = pending
+    with WebhookReceiver() as receiver:
+        httsleep = AsyncHttSleeper(URL, {'json': {'status': 'OK'}}, webhook=receiver,
+                                   transport=transport, polling_interval=60)
+
+        async def push_later():
+            await asyncio.sleep(0.1)
+            await asyncio.get_event_loop().run_in_executor(
+                None, lambda: requests.post(httsleep.callback_url, json={'status': 'OK'}))
+
+        async def main():
+            response, _ = await asyncio.gather(httsleep.run(), push_later())
+            return response
+
+        response = asyncio.run(asyncio.wait_for(main(), 5))
+    assert response.json() == {'status': 'OK'}
+    assert transport.send.call_count == 1
+
+
+def test_webhook_waits_hold_no_threads():
+    """Should wait for pushed payloads without holding an executor thread each"""
+    pending = requests.Response()
+    pending.status_code = 202
+    pending._content = b'{}'
+    transport = mock.Mock()
+    transport.send.return_value = pending
+    with WebhookReceiver() as receiver:
+        sleepers = [AsyncHttSleeper(URL, {'json': {'status': 'OK'}}, webhook=receiver,
+                                    transport=transport, polling_interval=60, history_size=5)
+                    for _ in range(10)]
+
+        async def main():
+            loop = asyncio.get_event_loop()
+            loop.set_default_executor(ThreadPoolExecutor(max_workers=2))
+            tasks = [asyncio.ensure_future(sleeper.run()) for sleeper in sleepers]
+            while transport.send.call_count < len(sleepers):
+                await asyncio.sleep(0.01)
+            for sleeper in sleepers:
+                await loop.run_in_executor(
+                    None, lambda: requests.post(sleeper.callback_url, json={'status': 'OK'}))
+            return await asyncio.gather(*tasks)
+
+        responses = asyncio.run(asyncio.wait_for(main(), 5))
+    assert [response.json() for response in responses] == [{'status': 'OK'}] * 10
+    assert [record.outcome for record in sleepers[0].history] == ['pending', 'success']
@@ -0,0 +1,114 @@
+import json
+import threading
+
+import httpretty
+import mock
+import pytest
+import requests
+
+from httsleep.batch import BatchPoller, make_response
+from httsleep.exceptions import Alarm, Cancelled
+from httsleep.simulation import VirtualClock
+
+URL = 'http://example.com/jobs'
+
+
+def build_request(keys):
+    return requests.Request(method='GET', url=URL, params={'ids': ','.join(keys)})
+
+
+def split_response(response, keys):
+    return dict((job['id'], job) for job in response.json()['jobs'])
+
+
+def jobs_body(**statuses):
+    return json.dumps({'jobs': [{'id': key, 'status': status}
+                                for key, status in sorted(statuses.items())]})
+
+
+def test_make_response():
+    response = make_response({'status': 'OK'})
+    assert response.status_code == 200
+    assert response.json() == {'status': 'OK'}
+
+
+def test_invalid_max_batch_size():
+    with pytest.raises(ValueError):
+        BatchPoller(build_request, split_response, max_batch_size=0)
+
+
+def test_invalid_conditions():
+    poller = BatchPoller(build_request, split_response)
+    with pytest.raises(ValueError):
+        poller.add('a')
+    with pytest.raises(ValueError):
+        poller.add('a', {'lol': 'invalid'})
+
+
+@httpretty.activate
+def test_run():
+    responses = [
+        httpretty.Response(body=jobs_body(a='PENDING', b='PENDING', c='PENDING')),
+        httpretty.Response(body=jobs_body(b='OK', c='ERROR')),
+        httpretty.Response(body=jobs_body(b='OK')),
+    ]
+    httpretty.register_uri(httpretty.GET, URL, responses=responses)
+    poller = BatchPoller(build_request, split_response, clock=VirtualClock())
+    poller.add('a', {'json': {'id': 'a', 'status': 'OK'}}, max_retries=3)
+    poller.add('b', {'json': {'id': 'b', 'status': 'OK'}})
+    poller.add('c', {'json': {'id': 'c', 'status': 'OK'}},
+               alarms={'jsonpath': [{'expression': 'status', 'value': 'ERROR'}]})
+    results = dict((key, (response, exception)) for key, response, exception in poller.run())
+    assert results['b'][0].json() == {'id': 'b', 'status': 'OK'}
+    assert isinstance(results['c'][1], Alarm)
+    assert isinstance(results['a'][1], StopIteration)
+    queries = [request.querystring['ids'] for request in httpretty.latest_requests()]
+    assert queries == [['a,b,c'], ['a,b,c'], ['a']]
+    assert poller.pending == []
+
+
+def test_max_batch_size():
+    session = mock.Mock()
+    session.send.side_effect = lambda request, **kwargs: make_response(
+        {'jobs': [{'id': key, 'status': 'OK'} for key in request.keys]})
+    session.prepare_request.side_effect = lambda request: mock.Mock(
+        keys=request.params['ids'].split(','))
+    poller = BatchPoller(build_request, split_response, max_batch_size=2,
+                         session=session, clock=VirtualClock())
+    for key in 'abcde':
+        poller.add(key, {'jsonpath': [{'expression': 'status', 'value': 'OK'}]})
+    results = list(poller.run())
+    assert sorted(key for key, response, exception in results) == list('abcde')
+    assert session.send.call_count == 3
+
+
+def test_batch_exception():
+    session = mock.Mock()
+    session.send.side_effect = requests.exceptions.ConnectionError
+    poller = BatchPoller(build_request, split_response, session=session, clock=VirtualClock())
+    poller.add('a', {'status_code': 200})
+    (key, response, exception), = list(poller.run())
+    assert isinstance(exception, requests.exceptions.ConnectionError)
+
+
+def test_ignore_exceptions():
+    session = mock.Mock()
+    session.send.side_effect = [requests.exceptions.ConnectionError,
+                                make_response({'jobs': [{'id': 'a', 'status': 'OK'}]})]
+    clock = VirtualClock()
+    poller = BatchPoller(build_request, split_response, session=session, clock=clock,
+                         polling_interval=5,
+                         ignore_exceptions=[requests.exceptions.ConnectionError])
+    poller.add('a', {'status_code': 200})
+    (key, response, exception), = list(poller.run())
+    assert exception is None
+    assert clock.time() == 5
+
+
+def test_cancel():
+    event = threading.Event()
+    event.set()
+    poller = BatchPoller(build_request, split_response, cancel_event=event)
+    poller.add('a', {'status_code': 200})
+    (key, response, exception), = list(poller.run())
+    assert isinstance(exception, Cancelled)
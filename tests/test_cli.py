@@ -0,0 +1,100 @@
+import io
+import json
+
+import httpretty
+import mock
+import pytest
+
+from httsleep.cli import (EXIT_ALARM, EXIT_ERROR, EXIT_RETRIES_EXHAUSTED, EXIT_SUCCESS,
+                          main)
+
+URL = 'http://example.com/'
+OTHER_URL = 'http://example.com/other'
+
+
+def run_cli(argv):
+    stdout = io.StringIO()
+    with mock.patch('httsleep.scheduler.time.sleep'):
+        exit_code = main(argv, stdout=stdout)
+    results = [json.loads(line) for line in stdout.getvalue().splitlines()]
+    return exit_code, results
+
+
+@httpretty.activate
+def test_success():
+    httpretty.register_uri(httpretty.GET, URL, body='OK', status=200)
+    exit_code, results = run_cli([URL])
+    assert exit_code == EXIT_SUCCESS
+    assert results == [{'id': 0, 'url': URL, 'result': 'success', 'status_code': 200}]
+
+
+@httpretty.activate
+def test_alarm():
+    httpretty.register_uri(httpretty.GET, URL, body='OK', status=200)
+    httpretty.register_uri(httpretty.GET, OTHER_URL, body='Not Found', status=404)
+    exit_code, results = run_cli([URL, OTHER_URL, '--alarm', '{"status_code": 404}'])
+    assert exit_code == EXIT_ALARM
+    results = dict((result['url'], result) for result in results)
+    assert results[URL]['result'] == 'success'
+    assert results[OTHER_URL]['result'] == 'alarm'
+    assert results[OTHER_URL]['alarm'] == {'status_code': 404}
+
+
+@httpretty.activate
+def test_retries_exhausted():
+    httpretty.register_uri(httpretty.GET, URL, body='Internal Server Error', status=500)
+    exit_code, results = run_cli([URL, '--max-retries', '3', '--polling-interval', '0'])
+    assert exit_code == EXIT_RETRIES_EXHAUSTED
+    assert results[0]['result'] == 'retries_exhausted'
+    assert len(httpretty.latest_requests()) == 3
+
+
+@httpretty.activate
+def test_sub_second_polling_interval():
+    httpretty.register_uri(httpretty.GET, URL, responses=[
+        httpretty.Response(body='', status=500),
+        httpretty.Response(body='', status=200),
+    ])
+    stdout = io.StringIO()
+    with mock.patch('httsleep.scheduler.time.sleep') as sleep:
+        assert main([URL, '--polling-interval', '0.5'], stdout=stdout) == EXIT_SUCCESS
+    # The interval isn't truncated to 0 seconds
+    timeout, = sleep.call_args_list[0][0]
+    assert 0.4 < timeout <= 0.5
+
+
+@httpretty.activate
+def test_error():
+    httpretty.register_uri(httpretty.GET, URL, body='not json', status=200)
+    exit_code, results = run_cli([URL, '--until', '{"json": {"status": "OK"}}'])
+    assert exit_code == EXIT_ERROR
+    assert results[0]['result'] == 'error'
+
+
+@httpretty.activate
+def test_targets_file(tmpdir):
+    httpretty.register_uri(httpretty.GET, URL, body='{"status": "OK"}', status=200)
+    httpretty.register_uri(httpretty.GET, URL, status=200)
+    targets = tmpdir.join('targets.jsonl')
+    targets.write('\n'.join([
+        json.dumps({'id': 'job-1', 'url': URL, 'until': {'json': {'status': 'OK'}}}),
+        '',
+        json.dumps({'id': 'job-2', 'url': URL}),
+    ]))
+    exit_code, results = run_cli(['--file', str(targets)])
+    assert exit_code == EXIT_SUCCESS
+    assert sorted(result['id'] for result in results) == ['job-1', 'job-2']
+
+
+def test_invalid_targets_file(tmpdir):
+    targets = tmpdir.join('targets.jsonl')
+    targets.write(json.dumps({'url': URL, 'invalid': True}))
+    with pytest.raises(SystemExit) as e:
+        run_cli(['--file', str(targets)])
+    assert e.value.code == 2
+
+
+def test_no_targets():
+    with pytest.raises(SystemExit) as e:
+        run_cli([])
+    assert e.value.code == 2
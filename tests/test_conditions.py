@@ -0,0 +1,151 @@
+import json
+
+import mock
+import pytest
+from requests import Response
+
+from httsleep.conditions import BodyCache, CompiledCondition, CompiledJSON, ConditionIndex, freeze
+from httsleep.main import HttSleeper
+
+
+def make_response(status_code=200, body=''):
+    resp = Response()
+    resp.status_code = status_code
+    resp._content = body.encode('utf-8')
+    resp.encoding = 'utf-8'
+    return resp
+
+
+def test_freeze_equal_values():
+    assert freeze({'a': [1, {'b': 2}]}) == freeze({'a': [1, {'b': 2}]})
+    assert hash(freeze({'a': 1, 'b': 2})) == hash(freeze({'b': 2, 'a': 1}))
+    assert freeze({'a': 1}) == freeze({'a': 1.0})
+
+
+def test_freeze_different_values():
+    assert freeze({'a': [1, 2]}) != freeze({'a': [2, 1]})
+    assert freeze({'a': 1}) != freeze({'a': 1, 'b': 2})
+
+
+def test_freeze_unhashable():
+    with pytest.raises(TypeError):
+        freeze({'a': set()})
+
+
+def candidates(index, response):
+    return [compiled.condition for compiled in index.candidates(response)]
+
+
+def test_candidates_by_status_code():
+    conditions = [{'status_code': code} for code in range(400, 600)]
+    index = ConditionIndex(conditions)
+    assert candidates(index, make_response(503)) == [{'status_code': 503}]
+    assert candidates(index, make_response(200)) == []
+
+
+def test_candidates_by_body():
+    conditions = [{'status_code': 500, 'json': {'error': i}} for i in range(100)]
+    index = ConditionIndex(conditions)
+    assert candidates(index, make_response(500, json.dumps({'error': 42}))) == [conditions[42]]
+    conditions = [{'status_code': 500, 'text': 'Error {}'.format(i)} for i in range(100)]
+    index = ConditionIndex(conditions)
+    assert candidates(index, make_response(500, 'Error 42')) == [conditions[42]]
+
+
+def test_candidates_keep_order():
+    conditions = [{'callback': lambda r: True}, {'status_code': 200}, {'jsonpath': []},
+                  {'text': 'OK'}]
+    index = ConditionIndex(conditions)
+    assert candidates(index, make_response(200, 'OK')) == conditions
+
+
+def test_candidates_undecodable_json():
+    """Should keep conditions on JSON as candidates, so their decoding errors surface"""
+    conditions = [{'json': {'status': 'OK'}}, {'json': {'status': 'ERROR'}}]
+    index = ConditionIndex(conditions)
+    assert candidates(index, make_response(200, 'not json')) == conditions
+
+
+def test_candidates_body_not_read_for_status_codes():
+    index = ConditionIndex([{'status_code': 200}])
+    resp = mock.Mock(status_code=200)
+    resp.json.side_effect = AssertionError
+    assert candidates(index, resp) == [{'status_code': 200}]
+
+
+def test_check_only_evaluates_candidates():
+    alarms = [{'status_code': 500, 'json': {'error': i}} for i in range(500)]
+    httsleep = HttSleeper('http://example.com', {'status_code': 200}, alarms=alarms)
+    resp = make_response(200, '{}')
+    with mock.patch.object(CompiledCondition, 'meets', return_value=True) as meets:
+        assert httsleep._check(resp)
+    assert meets.call_count == 1
+
+
+def test_compiled_json():
+    compiled = CompiledJSON({'status': 'OK', 'items': [1, 2]})
+    assert compiled.matches({'items': [1, 2], 'status': 'OK'})
+    assert not compiled.matches({'items': [1, 2], 'state': 'OK'})
+    assert not compiled.matches({'items': [1, 2], 'status': 'OK', 'extra': None})
+    assert not compiled.matches([{'items': [1, 2], 'status': 'OK'}])
+    assert CompiledJSON([1, 2]).matches([1, 2])
+    assert not CompiledJSON([1, 2]).matches([1, 2, 3])
+    assert CompiledJSON('OK').matches('OK')
+
+
+def test_compiled_json_rejects_different_keys_early():
+    expected = {'status': 'OK', 'payload': mock.MagicMock()}
+    compiled = CompiledJSON(expected)
+    assert not compiled.matches({'state': 'OK', 'payload': None})
+    assert not expected['payload'].__eq__.called
+
+
+def test_body_cache_reuses_verdict_for_identical_body():
+    compiled = CompiledCondition({'json': {'status': 'OK'}})
+    body = BodyCache()
+    with mock.patch.object(CompiledCondition, 'meets_body', wraps=compiled.meets_body) as meets_body:
+        for _ in range(3):
+            body.bind(make_response(200, '{"status": "PENDING"}'))
+            assert not compiled.meets(make_response(200, '{"status": "PENDING"}'), body)
+        assert meets_body.call_count == 1
+        response = make_response(200, '{"status": "OK"}')
+        body.bind(response)
+        assert compiled.meets(response, body)
+        assert meets_body.call_count == 2
+
+
+def test_body_cache_does_not_cache_callbacks():
+    callback = mock.Mock(return_value=True)
+    compiled = CompiledCondition({'text': 'OK', 'callback': callback})
+    body = BodyCache()
+    for _ in range(2):
+        response = make_response(200, 'OK')
+        body.bind(response)
+        assert compiled.meets(response, body)
+    assert callback.call_count == 2
+
+
+def test_few_json_conditions_not_indexed():
+    """Freezing the response body doesn't pay off for a single json condition"""
+    index = ConditionIndex([{'json': {'status': 'OK'}}])
+    with mock.patch('httsleep.conditions.freeze') as mock_freeze:
+        assert candidates(index, make_response(200, '{"status": "PENDING"}')) == [
+            {'json': {'status': 'OK'}}]
+    assert not mock_freeze.called
+
+
+def test_frozen_body_cached():
+    conditions = [{'json': {'status': i}} for i in range(10)]
+    index = ConditionIndex(conditions)
+    body = BodyCache()
+    calls = []
+    with mock.patch('httsleep.conditions.freeze', wraps=freeze) as mock_freeze:
+        for _ in range(3):
+            resp = make_response(200, '{"status": 3}')
+            body.bind(resp)
+            assert [compiled.condition for compiled in index.candidates(resp, body)] == [
+                conditions[3]]
+            calls.append(mock_freeze.call_count)
+    # The body is only frozen on the first poll
+    assert calls[0] > 0
+    assert calls[0] == calls[1] == calls[2]
@@ -0,0 +1,174 @@
+import socket
+import threading
+import time
+
+import mock
+import pytest
+import requests
+
+from httsleep.dns import DNSCache, DNSCachingAdapter
+from httsleep.main import HttSleeper
+from httsleep.simulation import VirtualClock
+from httsleep.transport import RequestsTransport, Transport
+
+http_server = pytest.importorskip('http.server')
+socketserver = pytest.importorskip('socketserver')
+
+ADDRINFO = [(socket.AF_INET, socket.SOCK_STREAM, 6, '', ('127.0.0.1', 80))]
+getaddrinfo = socket.getaddrinfo
+
+
+def fake_getaddrinfo(host, *args, **kwargs):
+    """ Resolves poller.invalid to the loopback address. """
+    return getaddrinfo('127.0.0.1' if host == 'poller.invalid' else host, *args, **kwargs)
+
+
+class KeepAliveServer(socketserver.ThreadingMixIn, http_server.HTTPServer):
+    """ A HTTP/1.1 server, which counts the connections made to it. """
+    daemon_threads = True
+
+    def __init__(self):
+        self.connections = 0
+        self.requests = []
+        server = self
+
+        class Handler(http_server.BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'
+
+            def do_GET(self):
+                server.requests.append(self.headers.get('Host'))
+                self.send_response(200)
+                self.send_header('Content-Length', '2')
+                self.end_headers()
+                self.wfile.write(b'OK')
+
+            def log_message(self, *args):
+                pass
+
+        http_server.HTTPServer.__init__(self, ('127.0.0.1', 0), Handler)
+        self.port = self.server_address[1]
+        thread = threading.Thread(target=self.serve_forever)
+        thread.daemon = True
+        thread.start()
+
+    def get_request(self):
+        self.connections += 1
+        return http_server.HTTPServer.get_request(self)
+
+
+def wait_for_connections(server, count, timeout=5):
+    """ Waits for the server to accept ``count`` connections, which happens in its
+    own thread, after the client has connected.
+    """
+    deadline = time.time() + timeout
+    while server.connections < count and time.time() < deadline:
+        time.sleep(0.01)
+    return server.connections
+
+
+@pytest.fixture
+def server():
+    server = KeepAliveServer()
+    yield server
+    server.shutdown()
+    server.server_close()
+
+
+def test_dns_cache_ttl():
+    clock = VirtualClock()
+    cache = DNSCache(ttl=60, clock=clock)
+    with mock.patch('socket.getaddrinfo', return_value=ADDRINFO * 2) as getaddrinfo:
+        assert cache.resolve('example.com', 80) == ['127.0.0.1']
+        clock.advance(59)
+        assert cache.resolve('example.com', 80) == ['127.0.0.1']
+        assert getaddrinfo.call_count == 1
+        clock.advance(1)
+        cache.resolve('example.com', 80)
+        assert getaddrinfo.call_count == 2
+        cache.invalidate('example.com', 80)
+        cache.resolve('example.com', 80)
+        assert getaddrinfo.call_count == 3
+    assert (cache.hits, cache.misses) == (1, 3)
+
+
+def test_dns_cache_resolves_once_for_concurrent_misses():
+    cache = DNSCache()
+
+    def slow_getaddrinfo(*args):
+        time.sleep(0.1)
+        return ADDRINFO
+
+    results = []
+    with mock.patch('socket.getaddrinfo', side_effect=slow_getaddrinfo) as getaddrinfo:
+        threads = [threading.Thread(target=lambda: results.append(
+            cache.resolve('example.com', 80))) for _ in range(10)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+    assert getaddrinfo.call_count == 1
+    assert results == [['127.0.0.1']] * 10
+    assert (cache.hits, cache.misses) == (9, 1)
+
+
+def test_dns_cache_forgets_failures():
+    cache = DNSCache()
+    with mock.patch('socket.getaddrinfo', side_effect=socket.gaierror('unknown host')):
+        with pytest.raises(socket.gaierror):
+            cache.resolve('example.invalid', 80)
+    # Failures aren't cached
+    with mock.patch('socket.getaddrinfo', return_value=ADDRINFO):
+        assert cache.resolve('example.invalid', 80) == ['127.0.0.1']
+
+
+def test_dns_caching_adapter(server):
+    cache = DNSCache()
+    session = requests.Session()
+    session.mount('http://', DNSCachingAdapter(cache))
+    url = 'http://poller.invalid:{}/'.format(server.port)
+    with mock.patch('socket.getaddrinfo', side_effect=fake_getaddrinfo) as resolve:
+        for _ in range(3):
+            # Close the connection, so that each request opens a new one
+            assert session.get(url, headers={'Connection': 'close'}).text == 'OK'
+    lookups = [args[0] for args, _ in resolve.call_args_list]
+    assert lookups.count('poller.invalid') == 1
+    assert server.connections == 3
+    # The original host name is kept in the Host header
+    assert server.requests[0] == 'poller.invalid:{}'.format(server.port)
+
+
+def test_dns_caching_adapter_tries_each_address(server):
+    cache = DNSCache()
+    session = requests.Session()
+    session.mount('http://', DNSCachingAdapter(cache))
+    url = 'http://poller.invalid:{}/'.format(server.port)
+    # Nothing listens on 127.0.0.2, so connecting to it is refused
+    addrinfo = [(socket.AF_INET, socket.SOCK_STREAM, 6, '', (address, server.port))
+                for address in ('127.0.0.2', '127.0.0.1')]
+    with mock.patch('socket.getaddrinfo', return_value=addrinfo):
+        assert session.get(url, headers={'Connection': 'close'}).text == 'OK'
+        assert cache.resolve('poller.invalid', server.port) == ['127.0.0.2', '127.0.0.1']
+        # The addresses are only forgotten once they have all failed
+        server.shutdown()
+        server.server_close()
+        with pytest.raises(requests.exceptions.ConnectionError):
+            session.get(url, headers={'Connection': 'close'})
+    assert cache.misses == 1
+    assert cache._entries == {}
+
+
+def test_prewarm(server):
+    url = 'http://127.0.0.1:{}/'.format(server.port)
+    transport = RequestsTransport(requests.Session(), dns_cache=DNSCache())
+    assert transport.prewarm(url, connections=3) == 3
+    assert wait_for_connections(server, 3) == 3
+    # The pre-warmed connections are reused by pollers
+    sleepers = [HttSleeper(url, {'text': 'OK'}, transport=transport) for _ in range(3)]
+    for sleeper in sleepers:
+        sleeper.run()
+    assert server.connections == 3
+    assert sleepers[0].prewarm(connections=20) == 10
+
+
+def test_prewarm_unsupported():
+    assert Transport().prewarm('http://example.com') == 0
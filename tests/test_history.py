@@ -0,0 +1,97 @@
+import hashlib
+
+import httpretty
+import mock
+import pytest
+
+from httsleep.exceptions import Alarm, RetriesExhausted
+from httsleep.history import PollHistory, PollRecord
+from httsleep.main import HttSleeper
+
+URL = 'http://example.com'
+
+
+def test_poll_history_is_bounded():
+    history = PollHistory(3)
+    for i in range(10):
+        history.append(PollRecord(i, 0.1, 200, 0, None, 'pending'))
+    assert len(history) == 3
+    assert [record.timestamp for record in history] == [7, 8, 9]
+
+
+def test_poll_history_size():
+    with pytest.raises(ValueError):
+        PollHistory(0)
+
+
+@httpretty.activate
+def test_no_history_by_default():
+    httpretty.register_uri(httpretty.GET, URL, status=200)
+    sleeper = HttSleeper(URL, {'status_code': 200})
+    sleeper.run()
+    assert sleeper.history is None
+
+
+@httpretty.activate
+def test_history_records_attempts():
+    httpretty.register_uri(httpretty.GET, URL, responses=[
+        httpretty.Response(body='{"status": "PENDING"}', status=200),
+        httpretty.Response(body='{"status": "OK"}', status=200),
+    ])
+    sleeper = HttSleeper(URL, [{'status_code': 500}, {'json': {'status': 'OK'}}],
+                         history_size=10)
+    with mock.patch('httsleep.main.sleep'):
+        sleeper.run()
+    pending, success = sleeper.history.records()
+    assert pending.outcome == 'pending'
+    assert pending.condition is None
+    assert pending.status_code == 200
+    assert pending.body_size == len(b'{"status": "PENDING"}')
+    assert pending.body_digest == hashlib.sha1(b'{"status": "PENDING"}').digest()
+    assert pending.latency >= 0
+    assert success.outcome == 'success'
+    assert success.condition == 1
+    assert success.timestamp >= pending.timestamp
+
+
+@httpretty.activate
+def test_alarm_carries_history():
+    httpretty.register_uri(httpretty.GET, URL, responses=[
+        httpretty.Response(body='', status=202),
+        httpretty.Response(body='', status=202),
+        httpretty.Response(body='', status=404),
+    ])
+    sleeper = HttSleeper(URL, {'status_code': 200},
+                         alarms=[{'status_code': 500}, {'status_code': 404}],
+                         history_size=2)
+    with mock.patch('httsleep.main.sleep'):
+        with pytest.raises(Alarm) as e:
+            sleeper.run()
+    assert [record.status_code for record in e.value.history] == [202, 404]
+    assert e.value.history[-1].outcome == 'alarm'
+    assert e.value.history[-1].condition == 1
+
+
+@httpretty.activate
+def test_retries_exhausted_carries_history():
+    httpretty.register_uri(httpretty.GET, URL, status=202)
+    sleeper = HttSleeper(URL, {'status_code': 200}, max_retries=5, history_size=3)
+    with mock.patch('httsleep.main.sleep'):
+        with pytest.raises(RetriesExhausted) as e:
+            sleeper.run()
+    assert isinstance(e.value, StopIteration)
+    assert len(e.value.history) == 3
+    assert all(record.outcome == 'pending' for record in e.value.history)
+
+
+@httpretty.activate
+def test_history_records_ignored_exceptions():
+    sleeper = HttSleeper(URL, {'status_code': 200}, max_retries=1, history_size=3,
+                         ignore_exceptions=[ValueError])
+    with mock.patch.object(sleeper, '_send', side_effect=ValueError('boom')):
+        with pytest.raises(RetriesExhausted) as e:
+            sleeper.run()
+    record, = e.value.history
+    assert record.outcome == 'error'
+    assert record.status_code is None
+    assert record.latency is None
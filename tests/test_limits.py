@@ -0,0 +1,116 @@
+import io
+
+import httpretty
+import mock
+import pytest
+import requests
+
+from httsleep.exceptions import Alarm, LimitExceeded
+from httsleep.limits import enforce_limits, media_type
+from httsleep.main import HttSleeper
+
+URL = 'http://example.com'
+
+
+class CountingReader(io.BytesIO):
+    bytes_read = 0
+
+    def read(self, amt=None):
+        data = super(CountingReader, self).read(amt)
+        self.bytes_read += len(data)
+        return data
+
+
+def make_streamed_response(body, headers=None):
+    response = requests.Response()
+    response.status_code = 200
+    response.raw = CountingReader(body)
+    response.headers.update(headers or {})
+    return response
+
+
+def test_media_type():
+    assert media_type('Application/JSON; charset=utf-8') == 'application/json'
+    assert media_type('') == ''
+
+
+def test_enforce_limits_reads_body():
+    response = make_streamed_response(b'0123456789')
+    enforce_limits(response, max_body_size=10)
+    assert response.content == b'0123456789'
+
+
+def test_enforce_limits_stops_reading():
+    response = make_streamed_response(b'x' * 1000000)
+    with pytest.raises(LimitExceeded) as e:
+        enforce_limits(response, max_body_size=100)
+    assert e.value.alarm == {'max_body_size': 100}
+    # Reading stopped after the first chunk exceeded the limit
+    assert response.raw.bytes_read < 1000000
+    assert response.raw.closed
+    assert response.content is None
+
+
+def test_enforce_limits_content_length():
+    response = make_streamed_response(b'', {'Content-Length': '1000'})
+    with pytest.raises(LimitExceeded):
+        enforce_limits(response, max_body_size=100)
+    assert response.raw.closed
+
+
+def test_enforce_limits_content_type():
+    response = make_streamed_response(b'{}', {'Content-Type': 'text/html'})
+    with pytest.raises(LimitExceeded) as e:
+        enforce_limits(response, content_types=['application/json'])
+    assert e.value.alarm == {'content_types': ['application/json']}
+    response = make_streamed_response(b'{}', {'Content-Type': 'application/json; charset=utf-8'})
+    enforce_limits(response, content_types=['application/json'])
+
+
+@httpretty.activate
+def test_max_body_size_alarm():
+    httpretty.register_uri(httpretty.GET, URL, body='x' * 1000)
+    httsleep = HttSleeper(URL, {'text': 'OK'}, max_body_size=100)
+    assert httsleep.kwargs['stream'] is True
+    with pytest.raises(Alarm) as e:
+        httsleep.run()
+    assert isinstance(e.value, LimitExceeded)
+
+
+@httpretty.activate
+def test_content_types_retry():
+    httpretty.register_uri(httpretty.GET, URL, responses=[
+        httpretty.Response(body='<html>Bad gateway</html>', content_type='text/html'),
+        httpretty.Response(body='{"status": "OK"}', content_type='application/json'),
+    ])
+    httsleep = HttSleeper(URL, {'json': {'status': 'OK'}}, content_types=['application/json'],
+                          max_body_size=100, on_limit='retry', history_size=2)
+    with mock.patch('httsleep.main.sleep'):
+        response = httsleep.run()
+    assert response.json() == {'status': 'OK'}
+    rejected, accepted = httsleep.history
+    assert rejected.outcome == 'error'
+    assert rejected.body_size is None
+    assert accepted.outcome == 'success'
+
+
+@httpretty.activate
+def test_content_types_alarm():
+    httpretty.register_uri(httpretty.GET, URL, body='<html>Bad gateway</html>',
+                           content_type='text/html')
+    httsleep = HttSleeper(URL, {'json': {'status': 'OK'}}, content_types=['application/json'])
+    assert httsleep.kwargs['stream'] is True
+    with pytest.raises(LimitExceeded):
+        httsleep.run()
+
+
+def test_enforce_limits_content_type_reads_body():
+    response = make_streamed_response(b'{}', {'Content-Type': 'application/json'})
+    enforce_limits(response, content_types=['application/json'])
+    # The accepted body has been read
+    assert response._content == b'{}'
+
+
+def test_invalid_on_limit():
+    with pytest.raises(ValueError):
+        HttSleeper(URL, {'status_code': 200}, on_limit='ignore')
@@ -0,0 +1,66 @@
+import json
+import pstats
+
+import httpretty
+import mock
+
+from httsleep import benchmark
+from httsleep.batch import make_response
+from httsleep.conditions import ConditionIndex, check_conditions
+from httsleep.main import HttSleeper
+from httsleep.profiling import CATEGORIES, PollProfiler
+
+URL = 'http://example.com'
+
+
+def test_make_body():
+    for size in [100, 10000]:
+        encoded = len(json.dumps(benchmark.make_body(size)))
+        # within one log line of the requested size
+        assert size - 60 < encoded <= size
+
+
+def test_benchmark_conditions_not_met():
+    response = make_response(benchmark.make_body(100))
+    for kind in benchmark.KINDS:
+        index = ConditionIndex(benchmark.make_conditions(kind, 3))
+        assert not check_conditions(response, index, ConditionIndex([]))
+
+
+def test_run_benchmarks():
+    results = list(benchmark.run_benchmarks(body_sizes=[100], counts=[1, 2], min_time=0))
+    assert [(kind, count) for kind, _, count, _ in results] == [
+        (kind, count) for kind in benchmark.KINDS for count in [1, 2]]
+    assert all(seconds > 0 for _, _, _, seconds in results)
+
+
+def test_benchmark_main():
+    stdout = mock.Mock()
+    assert benchmark.main(['--kinds', 'json', '--body-sizes', '100', '--counts', '1',
+                           '--min-time', '0'], stdout=stdout) == 0
+    output = ''.join(args[0] for args, _ in stdout.write.call_args_list)
+    assert output.splitlines()[1].split()[:3] == ['json', '100', '1']
+
+
+@httpretty.activate
+def test_profiler(tmpdir):
+    httpretty.register_uri(httpretty.GET, URL, responses=[
+        httpretty.Response(body='{"status": "PENDING"}'),
+        httpretty.Response(body='{"status": "OK"}'),
+    ])
+    profiler = PollProfiler()
+    callback = mock.Mock(return_value=True)
+    with mock.patch('httsleep.main.sleep'):
+        HttSleeper(URL, {'jsonpath': [{'expression': 'status', 'value': 'OK'}],
+                         'callback': callback},
+                   profiler=profiler).run()
+    totals = profiler.totals()
+    assert sorted(totals) == sorted(CATEGORIES)
+    assert all(totals[category] > 0 for category in CATEGORIES)
+    path = str(tmpdir.join('poll.prof'))
+    profiler.dump(path)
+    assert pstats.Stats(path).total_calls > 0
+
+
+def test_profiler_unused():
+    assert PollProfiler().totals() == dict.fromkeys(CATEGORIES, 0.0)
@@ -0,0 +1,84 @@
+import threading
+
+import mock
+import pytest
+from requests import Response
+
+from httsleep.main import HttSleeper
+from httsleep.ratelimit import (RateLimiter, TokenBucket, get_default_rate_limiter,
+                                set_default_rate_limiter)
+
+URL = 'http://example.com/jobs/1'
+
+
+def test_token_bucket_burst():
+    with mock.patch('httsleep.ratelimit.time.time', return_value=100.0):
+        bucket = TokenBucket(rate=2, burst=2)
+        assert bucket.reserve() == 0
+        assert bucket.reserve() == 0
+        assert bucket.reserve() == 0.5
+        assert bucket.reserve() == 1.0
+
+
+def test_token_bucket_refill():
+    with mock.patch('httsleep.ratelimit.time.time') as mock_time:
+        mock_time.return_value = 100.0
+        bucket = TokenBucket(rate=1)
+        assert bucket.reserve() == 0
+        mock_time.return_value = 101.0
+        assert bucket.reserve() == 0
+
+
+def test_token_bucket_invalid():
+    with pytest.raises(ValueError):
+        TokenBucket(rate=0)
+    with pytest.raises(ValueError):
+        TokenBucket(rate=1, burst=0)
+
+
+def test_rate_limiter_per_host():
+    limiter = RateLimiter(rate=1000, burst=1, per_host={'other.com': (1000, 5)})
+    with mock.patch('httsleep.ratelimit.time.sleep') as mock_sleep:
+        limiter.acquire('http://example.com/a')
+        limiter.acquire('http://example.com/b')
+        for _ in range(5):
+            limiter.acquire('http://other.com/a')
+    assert mock_sleep.call_count == 1
+    metrics = limiter.metrics()
+    assert metrics['example.com']['requests'] == 2
+    assert metrics['example.com']['delayed'] == 1
+    assert metrics['example.com']['waiting'] == 0
+    assert metrics['example.com']['max_delay'] > 0
+    assert metrics['other.com']['delayed'] == 0
+
+
+def test_rate_limiter_cancel_event():
+    limiter = RateLimiter(rate=0.001)
+    event = threading.Event()
+    event.set()
+    limiter.acquire(URL, event)
+    assert limiter.acquire(URL, event) > 100
+
+
+def test_httsleeper_uses_rate_limiter():
+    resp = Response()
+    resp.status_code = 200
+    limiter = mock.Mock()
+    httsleep = HttSleeper(URL, {'status_code': 200}, rate_limiter=limiter)
+    with mock.patch('requests.adapters.HTTPAdapter.send', return_value=resp):
+        httsleep.run()
+    limiter.acquire.assert_called_once_with(URL, httsleep.cancel_event)
+
+
+def test_default_rate_limiter():
+    resp = Response()
+    resp.status_code = 200
+    limiter = mock.Mock()
+    set_default_rate_limiter(limiter)
+    try:
+        assert get_default_rate_limiter() is limiter
+        with mock.patch('requests.adapters.HTTPAdapter.send', return_value=resp):
+            HttSleeper(URL, {'status_code': 200}).run()
+    finally:
+        set_default_rate_limiter(None)
+    assert limiter.acquire.called
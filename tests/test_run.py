@@ -1,4 +1,8 @@
+from concurrent.futures import Future
 import json
+import logging
+import threading
+import time
 
 import httpretty
 from jsonpath_rw.jsonpath import Fields
@@ -8,7 +12,9 @@ import requests
 from requests.exceptions import ConnectionError
 from requests import Response
 
-from httsleep.main import HttSleeper, Alarm, DEFAULT_POLLING_INTERVAL
+from httsleep.main import (HttSleeper, Alarm, DEFAULT_POLLING_INTERVAL, _close_response,
+                           _RequestBudget, cancel_all, httsleep_any)
+from httsleep.exceptions import Cancelled, RetriesExhausted
 
 URL = 'http://example.com'
 
@@ -164,7 +170,8 @@ def test_run_sleep_default_interval():
     httpretty.register_uri(httpretty.GET, URL, responses=responses)
     with mock.patch('httsleep.main.sleep') as mock_sleep:
         resp = HttSleeper(URL, {'status_code': 200}).run()
-        assert mock_sleep.called_once_with(DEFAULT_POLLING_INTERVAL)
+        assert mock_sleep.call_count == 1
+        assert mock_sleep.call_args[0][0] == DEFAULT_POLLING_INTERVAL
 
 
 @httpretty.activate
@@ -174,7 +181,8 @@ def test_run_sleep_custom_interval():
     httpretty.register_uri(httpretty.GET, URL, responses=responses)
     with mock.patch('httsleep.main.sleep') as mock_sleep:
         resp = HttSleeper(URL, {'status_code': 200}, polling_interval=6).run()
-        assert mock_sleep.called_once_with(6)
+        assert mock_sleep.call_count == 1
+        assert mock_sleep.call_args[0][0] == 6
 
 
 @httpretty.activate
@@ -340,3 +348,406 @@ def test_multiple_alarms():
             assert e.alarm == {'json': error_msg, 'status_code': 500}
         else:
             pytest.fail("No exception raised!")
+
+
+@httpretty.activate
+def test_cancel_before_run():
+    """Should not send any requests once cancelled"""
+    httpretty.register_uri(httpretty.GET, URL, body='<html></html>', status=200)
+    httsleep = HttSleeper(URL, {'status_code': 200})
+    httsleep.cancel()
+    with pytest.raises(Cancelled):
+        httsleep.run()
+    assert not httpretty.has_request()
+
+
+@httpretty.activate
+def test_cancel_wakes_up_sleep():
+    """Should stop waiting between requests as soon as it's cancelled"""
+    httpretty.register_uri(httpretty.GET, URL, body='Internal Server Error', status=500)
+    httsleep = HttSleeper(URL, {'status_code': 200}, polling_interval=60)
+    timer = threading.Timer(0.1, httsleep.cancel)
+    timer.start()
+    with pytest.raises(Cancelled):
+        httsleep.run()
+    assert len(httpretty.latest_requests()) == 1
+
+
+@httpretty.activate
+def test_shared_cancel_event():
+    """Should stop every HttSleeper sharing a cancellation token"""
+    httpretty.register_uri(httpretty.GET, URL, body='Internal Server Error', status=500)
+    event = threading.Event()
+    event.set()
+    for _ in range(3):
+        with pytest.raises(Cancelled):
+            HttSleeper(URL, {'status_code': 200}, cancel_event=event).run()
+
+
+@httpretty.activate
+def test_cancel_all():
+    """Should cancel all running HttSleepers"""
+    httpretty.register_uri(httpretty.GET, URL, body='Internal Server Error', status=500)
+    errors = []
+
+    def poll():
+        try:
+            HttSleeper(URL, {'status_code': 200}, polling_interval=60).run()
+        except Cancelled as e:
+            errors.append(e)
+
+    threads = [threading.Thread(target=poll) for _ in range(3)]
+    for thread in threads:
+        thread.start()
+    while len(httpretty.latest_requests()) < 3:
+        threading.Event().wait(0.01)
+    cancel_all()
+    for thread in threads:
+        thread.join(5)
+    assert len(errors) == 3
+
+
+def _response(status_code, url=URL):
+    resp = Response()
+    resp.status_code = status_code
+    resp.url = url
+    return resp
+
+
+def test_hedged_request_wins():
+    """Should send a duplicate request if the first one is slow, and use the first response"""
+    release = threading.Event()
+    sent = []
+
+    def send_request(request):
+        sent.append(request.url)
+        if len(sent) == 1:
+            release.wait(5)
+            return _response(500)
+        return _response(200, request.url)
+
+    httsleep = HttSleeper(URL, {'status_code': 200}, hedge_after=0.05,
+                          hedge_urls=['http://replica.example.com'])
+    with mock.patch.object(httsleep, '_send_request', side_effect=send_request):
+        resp = httsleep.run()
+    release.set()
+    assert resp.status_code == 200
+    assert resp.url == 'http://replica.example.com'
+    assert sent == [URL, 'http://replica.example.com']
+
+
+def test_hedging_not_held_up_by_slow_losers():
+    """Should hedge every poll, while the losing requests of earlier polls are in flight"""
+    release = threading.Event()
+
+    def send_request(request):
+        if request.url == URL:
+            release.wait(5)
+            return _response(200)
+        return _response(500, request.url)
+
+    httsleep = HttSleeper(URL, {'status_code': 200}, hedge_after=0.05, polling_interval=0,
+                          hedge_urls=['http://replica.example.com'], max_retries=3)
+    started = time.time()
+    with mock.patch.object(httsleep, '_send_request', side_effect=send_request):
+        with pytest.raises(StopIteration):
+            httsleep.run()
+    release.set()
+    assert time.time() - started < 2
+
+
+def test_close_response_without_raw():
+    future = Future()
+    future.set_result(_response(200))
+    _close_response(future)
+
+
+def test_no_hedge_for_fast_response():
+    httsleep = HttSleeper(URL, {'status_code': 200}, hedge_after=5)
+    with mock.patch.object(httsleep, '_send_request', return_value=_response(200)) as send:
+        resp = httsleep.run()
+    assert resp.status_code == 200
+    assert send.call_count == 1
+
+
+def test_hedge_after_percentile():
+    httsleep = HttSleeper(URL, {'status_code': 200}, hedge_after='p90')
+    assert httsleep._hedge_delay() is None
+    httsleep._latencies.extend([0.1] * 9 + [1.0])
+    assert httsleep._hedge_delay() == 1.0
+    httsleep._latencies.extend([0.1] * 10)
+    assert httsleep._hedge_delay() == 0.1
+
+
+def test_invalid_hedge_after():
+    with pytest.raises(ValueError):
+        HttSleeper(URL, {'status_code': 200}, hedge_after='fast')
+    with pytest.raises(ValueError):
+        HttSleeper(URL, {'status_code': 200}, hedge_after='p100')
+
+
+REPLICA_URL = 'http://replica.example.com/'
+
+
+@httpretty.activate
+def test_httsleep_any():
+    """Should return the first response meeting a success condition on any endpoint"""
+    httpretty.register_uri(httpretty.GET, URL, body='Internal Server Error', status=500)
+    httpretty.register_uri(httpretty.GET, REPLICA_URL, body='OK', status=200)
+    resp = httsleep_any([URL, REPLICA_URL], {'status_code': 200}, polling_interval=60)
+    assert resp.status_code == 200
+    assert resp.url == REPLICA_URL
+
+
+@httpretty.activate
+def test_httsleep_any_alarm():
+    httpretty.register_uri(httpretty.GET, URL, body='Internal Server Error', status=500)
+    httpretty.register_uri(httpretty.GET, REPLICA_URL, body='Not Found', status=404)
+    with pytest.raises(Alarm):
+        httsleep_any([URL, REPLICA_URL], {'status_code': 200}, alarms={'status_code': 404},
+                     polling_interval=60)
+
+
+@httpretty.activate
+def test_httsleep_any_max_requests():
+    """Should share one request budget between all endpoints"""
+    httpretty.register_uri(httpretty.GET, URL, body='Internal Server Error', status=500)
+    httpretty.register_uri(httpretty.GET, REPLICA_URL, body='Internal Server Error', status=500)
+    with pytest.raises(RetriesExhausted):
+        httsleep_any([URL, REPLICA_URL], {'status_code': 200}, polling_interval=0,
+                     max_requests=5)
+    assert len(httpretty.latest_requests()) == 5
+
+
+def test_race_stops_losers():
+    shared_event = threading.Event()
+    winner = HttSleeper(URL, {'status_code': 200}, cancel_event=shared_event)
+    loser = HttSleeper(REPLICA_URL, {'status_code': 200}, polling_interval=60,
+                       cancel_event=shared_event)
+    bystander = HttSleeper(URL, {'status_code': 200}, cancel_event=shared_event)
+    loser_finished = threading.Event()
+    loser_race = loser._race
+
+    def race(budget, stop):
+        try:
+            return loser_race(budget, stop)
+        finally:
+            loser_finished.set()
+
+    with mock.patch.object(winner, '_send', return_value=_response(200)), \
+            mock.patch.object(loser, '_send', return_value=_response(500)), \
+            mock.patch.object(loser, '_race', side_effect=race):
+        resp = HttSleeper.race([winner, loser])
+        assert loser_finished.wait(5)
+    assert resp.status_code == 200
+    # The shared cancellation token is left alone
+    assert not shared_event.is_set()
+    assert not bystander.cancelled
+
+
+def test_race_waits_for_losers():
+    """Should only return once the losers have stopped, so none of them is left sending"""
+    loser = HttSleeper(REPLICA_URL, {'status_code': 200}, polling_interval=0)
+    winner = HttSleeper(URL, {'status_code': 200})
+    loser_sending = threading.Event()
+    loser_sends = []
+
+    def winner_send():
+        assert loser_sending.wait(5)
+        return _response(200)
+
+    def loser_send():
+        # Still in flight when the race is over
+        loser_sending.set()
+        assert loser._race_stop.wait(5)
+        time.sleep(0.05)
+        loser_sends.append(time.time())
+        return _response(500)
+
+    with mock.patch.object(winner, '_send', side_effect=winner_send), \
+            mock.patch.object(loser, '_send', side_effect=loser_send):
+        resp = HttSleeper.race([winner, loser])
+    returned = time.time()
+    assert resp.status_code == 200
+    assert len(loser_sends) == 1
+    assert loser_sends[0] <= returned
+
+
+def test_race_over_before_sending():
+    """Should not send a request once the race is over"""
+    transport = mock.Mock()
+    httsleep = HttSleeper(URL, {'status_code': 200}, transport=transport)
+    httsleep._race_stop = threading.Event()
+    httsleep._race_stop.set()
+    assert httsleep._race(_RequestBudget(None), threading.Event()) is None
+    assert not transport.send.called
+
+
+def test_race_cancel_one():
+    """Cancelling one HttSleeper in a race wakes it up, without stopping the others"""
+    first = HttSleeper(URL, {'status_code': 200}, polling_interval=60)
+    second = HttSleeper(REPLICA_URL, {'status_code': 200})
+
+    def second_send():
+        # Only answer once the first HttSleeper has been cancelled
+        assert first.cancel_event.wait(5)
+        return _response(200)
+
+    timer = threading.Timer(0.1, first.cancel)
+    timer.start()
+    with mock.patch.object(first, '_send', return_value=_response(500)), \
+            mock.patch.object(second, '_send', side_effect=second_send):
+        resp = HttSleeper.race([first, second])
+    assert resp.status_code == 200
+    assert first.cancelled
+
+
+@httpretty.activate
+def test_auto_head():
+    """Should send HEAD requests when no condition needs the response body"""
+    httpretty.register_uri(httpretty.HEAD, URL, status=200)
+    resp = HttSleeper(URL, {'status_code': 200}, auto_head=True).run()
+    assert resp.status_code == 200
+    assert httpretty.last_request().method == 'HEAD'
+    # The response of a HEAD request has no body
+    assert resp.content == b''
+
+
+@httpretty.activate
+def test_auto_head_not_used_when_body_needed():
+    httpretty.register_uri(httpretty.GET, URL, body='OK', status=200)
+    resp = HttSleeper(URL, {'status_code': 200}, alarms={'text': 'ERROR'}, auto_head=True).run()
+    assert resp.text == 'OK'
+    assert httpretty.last_request().method == 'GET'
+
+
+@httpretty.activate
+def test_auto_head_opt_in():
+    httpretty.register_uri(httpretty.GET, URL, body='OK', status=200)
+    httsleep = HttSleeper(URL, {'status_code': 200})
+    assert not httsleep.uses_head
+    assert httsleep.run().text == 'OK'
+    assert httpretty.last_request().method == 'GET'
+
+
+@httpretty.activate
+def test_auto_head_not_used_for_request_objects():
+    httpretty.register_uri(httpretty.POST, URL, body='OK', status=200)
+    HttSleeper(requests.Request(method='POST', url=URL), {'status_code': 200},
+               auto_head=True).run()
+    assert httpretty.last_request().method == 'POST'
+
+
+@httpretty.activate
+def test_auto_head_fallback():
+    """Should fall back to GET requests if the server rejects HEAD requests"""
+    httpretty.register_uri(httpretty.HEAD, URL, status=405)
+    httpretty.register_uri(httpretty.GET, URL, body='OK', status=200)
+    httsleep = HttSleeper(URL, {'status_code': 200}, auto_head=True)
+    resp = httsleep.run()
+    assert resp.status_code == 200
+    assert [request.method for request in httpretty.latest_requests()] == ['HEAD', 'GET']
+    assert not httsleep.uses_head
+
+
+@httpretty.activate
+def test_auto_head_fallback_on_error():
+    """Should trust error status codes only from GET requests"""
+    httpretty.register_uri(httpretty.HEAD, URL, status=404)
+    httpretty.register_uri(httpretty.GET, URL, body='{"status": "OK"}', status=200)
+    httsleep = HttSleeper(URL, {'status_code': 200}, alarms={'status_code': 404},
+                          auto_head=True)
+    assert httsleep.run().json() == {'status': 'OK'}
+    assert [request.method for request in httpretty.latest_requests()] == ['HEAD', 'GET']
+    # HEAD and GET requests got different status codes, so HEAD isn't used anymore
+    assert not httsleep.uses_head
+
+
+@httpretty.activate
+def test_auto_head_kept_while_not_ready():
+    """Should keep sending HEAD requests if GET requests get the same error"""
+    httpretty.register_uri(httpretty.HEAD, URL, responses=[
+        httpretty.Response(body='', status=404), httpretty.Response(body='', status=200)])
+    httpretty.register_uri(httpretty.GET, URL, body='Not Found', status=404)
+    httsleep = HttSleeper(URL, {'status_code': 200}, auto_head=True)
+    with mock.patch('httsleep.main.sleep'):
+        assert httsleep.run().status_code == 200
+    assert [request.method for request in httpretty.latest_requests()] == [
+        'HEAD', 'GET', 'HEAD']
+
+
+def test_uses_head_follows_conditions():
+    httsleep = HttSleeper(URL, {'status_code': 200}, auto_head=True)
+    assert httsleep.uses_head
+    httsleep.alarms = [{'text': 'ERROR'}]
+    assert not httsleep.uses_head
+    httsleep.alarms = []
+    assert httsleep.uses_head
+
+
+@httpretty.activate
+def test_headers_condition():
+    responses = [httpretty.Response(body='', status=200, adding_headers={'X-Job-Status': 'RUNNING'}),
+                 httpretty.Response(body='', status=200, adding_headers={'X-Job-Status': 'DONE'})]
+    httpretty.register_uri(httpretty.HEAD, URL, responses=responses)
+    with mock.patch('httsleep.main.sleep'):
+        resp = HttSleeper(URL, {'headers': {'x-job-status': 'DONE'}}, auto_head=True).run()
+    assert resp.headers['X-Job-Status'] == 'DONE'
+    assert httpretty.last_request().method == 'HEAD'
+
+
+@httpretty.activate
+def test_run_does_not_consume_max_retries():
+    """Should be able to run the same HttSleeper again, with the same number of retries"""
+    httpretty.register_uri(httpretty.GET, URL, status=500)
+    httsleep = HttSleeper(URL, {'status_code': 200}, max_retries=2)
+    with mock.patch('httsleep.main.sleep'):
+        for _ in range(2):
+            with pytest.raises(StopIteration):
+                httsleep.run()
+    assert httsleep.max_retries == 2
+    assert len(httpretty.latest_requests()) == 4
+
+
+def test_init_leaves_logging_configuration_alone():
+    root = logging.getLogger()
+    level = root.level
+    HttSleeper(URL, {'status_code': 200}, loglevel=logging.DEBUG)
+    assert root.level == level
+    assert logging.getLogger('httsleep').level == logging.NOTSET
+
+
+class _FormatCounter(Exception):
+    formatted = 0
+
+    def __str__(self):
+        _FormatCounter.formatted += 1
+        return 'format counter'
+
+
+def test_log_messages_formatted_lazily(caplog):
+    _FormatCounter.formatted = 0
+    httsleep = HttSleeper(URL, {'status_code': 200}, max_retries=2,
+                          ignore_exceptions=[_FormatCounter])
+    with mock.patch.object(httsleep, '_send', side_effect=_FormatCounter):
+        with mock.patch('httsleep.main.sleep'):
+            with caplog.at_level(logging.DEBUG, logger='httsleep'):
+                with pytest.raises(StopIteration):
+                    httsleep.run()
+    assert _FormatCounter.formatted == 0
+    assert caplog.records == []
+
+
+def test_log_records_carry_url(caplog):
+    httsleep = HttSleeper(URL, {'status_code': 200}, max_retries=2,
+                          ignore_exceptions=[_FormatCounter], loglevel=logging.INFO)
+    with mock.patch.object(httsleep, '_send', side_effect=_FormatCounter):
+        with mock.patch('httsleep.main.sleep'):
+            with caplog.at_level(logging.INFO, logger='httsleep'):
+                with pytest.raises(StopIteration):
+                    httsleep.run()
+    messages = [record.getMessage() for record in caplog.records]
+    assert messages == ['Ignoring exception: format counter',
+                        'Not ready, waiting 2 seconds...',
+                        'Ignoring exception: format counter']
+    assert all(record.name == 'httsleep' and record.url == URL for record in caplog.records)
@@ -0,0 +1,115 @@
+import threading
+
+import pytest
+
+from httsleep.ratelimit import RateLimiter, set_default_rate_limiter
+from httsleep.simulation import Simulator, Trace, VirtualClock
+
+UNTIL = {'json': {'status': 'OK'}}
+
+
+def test_virtual_clock():
+    clock = VirtualClock(10)
+    clock.sleep(5)
+    assert clock.time() == 15
+    event = threading.Event()
+    event.set()
+    clock.sleep(5, event)
+    assert clock.time() == 15
+
+
+def test_trace_state_at():
+    trace = Trace([(0, 202, 'pending'), (10, 500, 'error'), (20, 200, 'done')])
+    assert trace.state_at(0) == (202, 'pending')
+    assert trace.state_at(9.9) == (202, 'pending')
+    assert trace.state_at(10) == (500, 'error')
+    assert trace.state_at(1000) == (200, 'done')
+    assert trace.ready_at == 20
+
+
+def test_trace_requires_states():
+    with pytest.raises(ValueError):
+        Trace([])
+
+
+def test_simulate_polling_interval():
+    report = Simulator([Trace.synthetic(ready_at=95)]).run(until=UNTIL, polling_interval=10)
+    result = report.results[0]
+    assert result.outcome == 'success'
+    # Requests at t=0, 10, ..., 100
+    assert result.requests == 11
+    assert result.latency == 5
+    assert report.total_requests == 11
+
+
+def test_simulate_fractional_polling_interval():
+    report = Simulator([Trace.synthetic(ready_at=10)]).run(until=UNTIL, polling_interval=2.5)
+    # Requests at t=0, 2.5, 5, 7.5, 10
+    assert report.results[0].requests == 5
+    assert report.results[0].latency == 0
+
+
+def test_simulate_without_advancing_time():
+    simulator = Simulator([Trace.synthetic(ready_at=10)])
+    with pytest.raises(ValueError):
+        simulator.run(until=UNTIL, polling_interval=0, max_retries=None, duration=60)
+    report = simulator.run(until=UNTIL, polling_interval=0, max_retries=3)
+    assert report.results[0].outcome == 'retries_exhausted'
+
+
+def test_simulate_duration():
+    traces = [Trace([(0, 500, 'down')]), Trace.synthetic(ready_at=30)]
+    simulator = Simulator(traces)
+    with pytest.raises(ValueError):
+        simulator.run(until={'status_code': 200}, max_retries=None, polling_interval=60)
+    report = simulator.run(until={'status_code': 200}, max_retries=None, polling_interval=60,
+                           duration=3600)
+    never_ready, ready = report.results
+    assert never_ready.outcome == 'undetected'
+    assert never_ready.requests == 60
+    assert never_ready.finished_at == 3600
+    assert never_ready.latency is None
+    assert ready.outcome == 'success'
+
+
+@pytest.mark.parametrize('kwargs', [{'hedge_after': 1}, {'webhook': object()},
+                                    {'rate_limiter': RateLimiter(rate=1)}])
+def test_simulate_rejects_real_time_waits(kwargs):
+    with pytest.raises(ValueError):
+        Simulator([Trace.synthetic(ready_at=10)]).run(until=UNTIL, **kwargs)
+
+
+def test_simulate_rejects_default_rate_limiter():
+    set_default_rate_limiter(RateLimiter(rate=1))
+    try:
+        with pytest.raises(ValueError):
+            Simulator([Trace.synthetic(ready_at=10)]).run(until=UNTIL)
+    finally:
+        set_default_rate_limiter(None)
+
+
+def test_simulate_hours_quickly():
+    traces = [Trace.synthetic(ready_at=3600 * hours) for hours in range(1, 6)]
+    report = Simulator(traces).run(until=UNTIL, polling_interval=60, max_retries=None,
+                                   duration=6 * 3600)
+    assert report.count('success') == 5
+    assert report.latencies == [0, 0, 0, 0, 0]
+    assert report.total_requests == sum(60 * hours + 1 for hours in range(1, 6))
+
+
+def test_simulate_outcomes():
+    traces = [Trace.synthetic(ready_at=1000),
+              Trace.synthetic(ready_at=10, ready=(500, {'status': 'ERROR'}))]
+    report = Simulator(traces).run(until=UNTIL, alarms={'status_code': 500},
+                                   polling_interval=10, max_retries=5)
+    assert [result.outcome for result in report.results] == ['retries_exhausted', 'alarm']
+    assert report.latencies == []
+    assert report.mean_latency is None
+
+
+def test_compare_policies():
+    traces = [Trace.synthetic(ready_at=ready_at, latency=0.5) for ready_at in (7, 33, 61)]
+    reports = Simulator(traces).compare({'fast': {'polling_interval': 1},
+                                         'slow': {'polling_interval': 30}}, until=UNTIL)
+    assert reports['fast'].total_requests > reports['slow'].total_requests
+    assert reports['fast'].latency_percentile(100) < reports['slow'].latency_percentile(100)
@@ -0,0 +1,88 @@
+import threading
+
+import httpretty
+import pytest
+
+from httsleep.spec import PollSpec
+
+URL_TEMPLATE = 'http://example.com/jobs/{job_id}'
+
+
+def test_immutable():
+    spec = PollSpec(URL_TEMPLATE, {'status_code': 200})
+    with pytest.raises(AttributeError):
+        spec.url = 'http://example.com'
+    with pytest.raises(AttributeError):
+        spec.max_retries = 5
+
+
+def test_validates_once():
+    with pytest.raises(ValueError):
+        PollSpec(URL_TEMPLATE, {'lol': 'invalid'})
+
+
+def test_bind_url_template():
+    spec = PollSpec(URL_TEMPLATE, {'status_code': 200}, max_retries=5)
+    first = spec.bind(job_id=1)
+    second = spec.bind(job_id=2)
+    assert first.request.url == 'http://example.com/jobs/1'
+    assert second.request.url == 'http://example.com/jobs/2'
+    assert spec.url == URL_TEMPLATE
+    assert first.max_retries == second.max_retries == 5
+    assert first._until_index is second._until_index
+    assert first.cancel_event is not second.cancel_event
+    assert first._body_cache is not second._body_cache
+
+
+def test_bind_url():
+    spec = PollSpec(URL_TEMPLATE, {'status_code': 200})
+    assert spec.bind(url='http://example.com/other').request.url == 'http://example.com/other'
+
+
+def test_bind_missing_parameter():
+    spec = PollSpec(URL_TEMPLATE, {'status_code': 200})
+    with pytest.raises(ValueError):
+        spec.bind(other=1)
+
+
+def test_bind_copies_mutable_settings():
+    spec = PollSpec(URL_TEMPLATE, {'status_code': 200}, headers={'X-Token': 'secret'},
+                    verify=False)
+    first = spec.bind(job_id=1)
+    first.request.headers['X-Token'] = 'other'
+    first.kwargs['timeout'] = 5
+    second = spec.bind(job_id=2)
+    assert second.request.headers == {'X-Token': 'secret'}
+    assert second.kwargs == {'verify': False}
+    assert spec._prototype.request.headers == {'X-Token': 'secret'}
+
+
+def test_bind_hedge_urls():
+    spec = PollSpec(URL_TEMPLATE, {'status_code': 200}, hedge_after=1,
+                    hedge_urls=['http://replica.example.com/jobs/{job_id}'])
+    first = spec.bind(job_id=1)
+    second = spec.bind(job_id=2)
+    assert [r.url for r in first._hedge_requests] == ['http://replica.example.com/jobs/1']
+    assert [r.url for r in second._hedge_requests] == ['http://replica.example.com/jobs/2']
+    assert first._hedge_requests[0] is not second._hedge_requests[0]
+    with pytest.raises(ValueError):
+        spec.bind(other=1)
+
+
+def test_bind_shares_cancel_event():
+    event = threading.Event()
+    spec = PollSpec(URL_TEMPLATE, {'status_code': 200}, cancel_event=event)
+    assert spec.bind(job_id=1).cancel_event is event
+
+
+@httpretty.activate
+def test_run_reusable():
+    """Should be able to run the same template repeatedly, each with its own retries"""
+    httpretty.register_uri(httpretty.GET, 'http://example.com/jobs/1', status=500)
+    httpretty.register_uri(httpretty.GET, 'http://example.com/jobs/2', status=200)
+    spec = PollSpec(URL_TEMPLATE, {'status_code': 200}, max_retries=2, polling_interval=0)
+    for _ in range(2):
+        with pytest.raises(StopIteration):
+            spec.run(job_id=1)
+    assert spec.run(job_id=2).status_code == 200
+    assert len(httpretty.latest_requests()) == 5
@@ -0,0 +1,249 @@
+import socket
+import threading
+
+import httpretty
+import mock
+import pytest
+import requests
+
+from httsleep.main import HttSleeper
+from httsleep.transport import RequestsTransport, Transport
+
+URL = 'http://example.com/'
+
+
+def test_transport_interface():
+    with pytest.raises(NotImplementedError):
+        Transport().send(requests.Request(method='GET', url=URL))
+
+
+@httpretty.activate
+def test_requests_transport():
+    httpretty.register_uri(httpretty.GET, URL, body='OK', status=200)
+    httpretty.register_uri(httpretty.HEAD, URL, status=204)
+    transport = RequestsTransport()
+    request = requests.Request(method='GET', url=URL)
+    assert transport.send(request).text == 'OK'
+    assert transport.send(request, method='HEAD').status_code == 204
+
+
+def test_httsleeper_uses_transport():
+    response = requests.Response()
+    response.status_code = 200
+    transport = mock.Mock()
+    transport.send.return_value = response
+    httsleep = HttSleeper(URL, {'status_code': 200}, transport=transport, verify=False)
+    assert httsleep.run() is response
+    args, kwargs = transport.send.call_args
+    assert args[0] is httsleep.request
+    assert kwargs == {'verify': False}
+
+
+class H2Server(object):
+    """ A minimal HTTP/2 server (without TLS), which answers every request with
+    the same response, and counts connections and requests. Requests are only
+    answered once ``batch`` of them are pending on a connection, so that with a
+    ``batch`` above 1 they are only answered if they were sent concurrently.
+    """
+    def __init__(self, status=200, body=b'{"status": "OK"}', batch=1):
+        self.status = status
+        self.body = body
+        self.batch = batch
+        self.connections = 0
+        self.requests = []
+        self.sock = socket.socket()
+        self.sock.bind(('127.0.0.1', 0))
+        self.sock.listen(5)
+        self.url = 'http://127.0.0.1:{}/jobs/1'.format(self.sock.getsockname()[1])
+        thread = threading.Thread(target=self._serve)
+        thread.daemon = True
+        thread.start()
+
+    def _serve(self):
+        while True:
+            try:
+                client, _ = self.sock.accept()
+            except OSError:
+                return
+            self.connections += 1
+            thread = threading.Thread(target=self._handle, args=(client,))
+            thread.daemon = True
+            thread.start()
+
+    def _handle(self, client):
+        import h2.config
+        import h2.connection
+        import h2.events
+        conn = h2.connection.H2Connection(h2.config.H2Configuration(client_side=False))
+        conn.initiate_connection()
+        client.sendall(conn.data_to_send())
+        pending = []
+        while True:
+            data = client.recv(65535)
+            if not data:
+                return
+            for event in conn.receive_data(data):
+                if isinstance(event, h2.events.RequestReceived):
+                    self.requests.append(dict(event.headers))
+                    pending.append(event.stream_id)
+            if len(pending) >= self.batch:
+                for stream_id in pending:
+                    conn.send_headers(stream_id, [
+                        (':status', str(self.status)),
+                        ('content-type', 'application/json'),
+                        ('content-length', str(len(self.body))),
+                    ])
+                    conn.send_data(stream_id, self.body, end_stream=True)
+                pending = []
+            client.sendall(conn.data_to_send())
+
+    def close(self):
+        self.sock.close()
+
+
+@pytest.fixture
+def h2_server():
+    pytest.importorskip('h2')
+    server = H2Server()
+    yield server
+    server.close()
+
+
+def test_http2_transport(h2_server):
+    pytest.importorskip('httpx')
+    from httsleep.transport import HTTP2Transport
+    session = requests.Session()
+    session.headers['X-Token'] = 'secret'
+    transport = HTTP2Transport(session=session, http1=False)
+    try:
+        response = HttSleeper(h2_server.url, {'json': {'status': 'OK'}},
+                              transport=transport).run()
+    finally:
+        transport.close()
+    assert response.status_code == 200
+    assert response.json() == {'status': 'OK'}
+    assert response.headers['Content-Type'] == 'application/json'
+    assert h2_server.requests[0][b'x-token'] == b'secret'
+    assert h2_server.requests[0][b':method'] == b'GET'
+
+
+def test_http2_transport_multiplexes():
+    pytest.importorskip('httpx')
+    pytest.importorskip('h2')
+    from httsleep.transport import HTTP2Transport
+    # Nothing is answered until all 5 requests are in flight, so with HTTP/1.1 they
+    # would need 5 connections
+    server = H2Server(batch=5)
+    transport = HTTP2Transport(http1=False)
+    responses = []
+
+    def poll():
+        responses.append(HttSleeper(server.url, {'json': {'status': 'OK'}},
+                                    transport=transport).run())
+
+    try:
+        threads = [threading.Thread(target=poll) for _ in range(5)]
+        for thread in threads:
+            thread.daemon = True
+            thread.start()
+        for thread in threads:
+            thread.join(5)
+    finally:
+        transport.close()
+        server.close()
+    assert [response.status_code for response in responses] == [200] * 5
+    assert server.connections == 1
+
+
+def test_http2_transport_verify():
+    pytest.importorskip('httpx')
+    from httsleep.transport import HTTP2Transport
+    transport = HTTP2Transport()
+    with pytest.raises(ValueError):
+        transport.send(requests.Request(method='GET', url=URL), verify=False)
+
+
+def test_http2_transport_streams_limited_bodies(h2_server):
+    pytest.importorskip('httpx')
+    from httsleep.exceptions import LimitExceeded
+    from httsleep.transport import HTTP2Transport
+    transport = HTTP2Transport(http1=False)
+    try:
+        response = HttSleeper(h2_server.url, {'json': {'status': 'OK'}}, transport=transport,
+                              max_body_size=100).run()
+        assert response.json() == {'status': 'OK'}
+        with pytest.raises(LimitExceeded):
+            HttSleeper(h2_server.url, {'json': {'status': 'OK'}}, transport=transport,
+                       max_body_size=10).run()
+    finally:
+        transport.close()
+
+
+def mock_http2_transport(handler):
+    """ Returns a HTTP2Transport whose requests are answered by ``handler``. """
+    httpx = pytest.importorskip('httpx')
+    from httsleep.transport import HTTP2Transport
+    transport = HTTP2Transport()
+    transport.client.close()
+    transport.client = httpx.Client(transport=httpx.MockTransport(handler))
+    return transport
+
+
+def test_http2_transport_follows_redirects():
+    import httpx
+
+    def handler(request):
+        # Responses with a stream, rather than content, are read like real ones
+        if request.url.path == '/old':
+            return httpx.Response(302, headers={'Location': URL + 'new'},
+                                  stream=httpx.ByteStream(b''))
+        return httpx.Response(200, stream=httpx.ByteStream(b'OK'))
+
+    transport = mock_http2_transport(handler)
+    request = requests.Request(method='GET', url=URL + 'old')
+    response = transport.send(request)
+    assert (response.status_code, response.text) == (200, 'OK')
+    assert transport.send(request, allow_redirects=False).status_code == 302
+
+
+def test_http2_transport_maps_exceptions():
+    import httpx
+
+    def handler(request):
+        if request.url.path == '/slow':
+            raise httpx.ReadTimeout('timed out', request=request)
+        raise httpx.ConnectError('refused', request=request)
+
+    transport = mock_http2_transport(handler)
+    with pytest.raises(requests.exceptions.ReadTimeout):
+        transport.send(requests.Request(method='GET', url=URL + 'slow'), timeout=(1, 2))
+    with pytest.raises(requests.exceptions.ConnectionError) as e:
+        transport.send(requests.Request(method='GET', url=URL))
+    assert e.value.request.url == URL
+    # So that ignore_exceptions works as with the default transport
+    sleeper = HttSleeper(URL, {'status_code': 200}, transport=transport, max_retries=2,
+                         polling_interval=0,
+                         ignore_exceptions=[requests.exceptions.ConnectionError])
+    with pytest.raises(StopIteration):
+        sleeper.run()
+
+
+def test_http2_transport_timeout():
+    pytest.importorskip('httpx')
+    from httsleep.transport import _to_httpx_timeout
+    timeout = _to_httpx_timeout((1, 2))
+    assert (timeout.connect, timeout.read, timeout.write) == (1, 2, 2)
+    assert _to_httpx_timeout(5).connect == 5
+
+
+def test_http2_transport_unsupported_kwargs():
+    pytest.importorskip('httpx')
+    from httsleep.transport import HTTP2Transport
+    transport = HTTP2Transport()
+    request = requests.Request(method='GET', url=URL)
+    with pytest.raises(ValueError):
+        transport.send(request, cert='client.pem')
+    with pytest.raises(ValueError):
+        transport.send(request, proxies={'http': 'http://proxy:3128'})
+    with pytest.raises(TypeError):
+        transport.send(request, hooks={})
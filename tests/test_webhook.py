@@ -0,0 +1,138 @@
+import socket
+import threading
+import time
+
+import mock
+import pytest
+import requests
+
+from httsleep.exceptions import Alarm, Cancelled
+from httsleep.main import HttSleeper
+from httsleep.webhook import WebhookReceiver
+
+URL = 'http://example.com/jobs/1'
+
+
+@pytest.fixture
+def receiver():
+    receiver = WebhookReceiver()
+    yield receiver
+    receiver.close()
+
+
+def pending_transport():
+    response = requests.Response()
+    response.status_code = 200
+    response._content = b'{"status": "PENDING"}'
+    transport = mock.Mock()
+    transport.send.return_value = response
+    return transport
+
+
+def push_later(url, payload, delay=0.1):
+    def push():
+        time.sleep(delay)
+        requests.post(url, json=payload)
+    thread = threading.Thread(target=push)
+    thread.start()
+    return thread
+
+
+def test_receiver(receiver):
+    registration = receiver.register()
+    assert registration.url.startswith('http://127.0.0.1:{}/'.format(receiver.port))
+    response = requests.post(registration.url, json={'status': 'OK'})
+    assert response.status_code == 204
+    pushed = registration.get(timeout=1)
+    assert pushed.status_code == 200
+    assert pushed.json() == {'status': 'OK'}
+    assert pushed.headers['Content-Type'] == 'application/json'
+    assert registration.get(timeout=0.01) is None
+    registration.close()
+    assert requests.post(registration.url, json={}).status_code == 404
+
+
+def test_receiver_payload_size():
+    with WebhookReceiver(max_payload_size=10, public_url='http://myhost/hooks/') as receiver:
+        registration = receiver.register()
+        assert registration.url.startswith('http://myhost/hooks/')
+        url = 'http://127.0.0.1:{}/{}'.format(receiver.port, registration.token)
+        assert requests.post(url, data=b'x' * 11).status_code == 413
+        assert requests.post(url, data=b'x' * 10).status_code == 204
+
+
+def post_raw(receiver, token, content_length):
+    """ Sends a POST request with the given Content-Length header, which Requests
+    wouldn't send, and returns the status code of the reply.
+    """
+    connection = socket.create_connection(('127.0.0.1', receiver.port), timeout=5)
+    try:
+        connection.sendall('POST /{} HTTP/1.0\r\nContent-Length: {}\r\n\r\n{{}}'.format(
+            token, content_length).encode('ascii'))
+        return int(connection.makefile('rb').readline().split()[1])
+    finally:
+        connection.close()
+
+
+def test_receiver_bad_content_length(receiver):
+    registration = receiver.register()
+    assert post_raw(receiver, registration.token, -1) == 400
+    assert post_raw(receiver, registration.token, 'abc') == 400
+    assert post_raw(receiver, registration.token, 2) == 204
+    assert registration.get(timeout=1).json() == {}
+    assert registration.get(timeout=0.01) is None
+
+
+def test_pushed_success(receiver):
+    transport = pending_transport()
+    sleeper = HttSleeper(URL, {'json': {'status': 'OK'}}, webhook=receiver,
+                         transport=transport, polling_interval=60)
+    thread = push_later(sleeper.callback_url, {'status': 'OK'})
+    started = time.time()
+    response = sleeper.run()
+    thread.join()
+    assert time.time() - started < 5
+    assert response.json() == {'status': 'OK'}
+    assert transport.send.call_count == 1
+    # The callback URL is unregistered once the HttSleeper has finished
+    assert receiver.registrations == {}
+
+
+def test_pushed_alarm(receiver):
+    sleeper = HttSleeper(URL, {'json': {'status': 'OK'}}, alarms={'json': {'status': 'ERROR'}},
+                         webhook=receiver, transport=pending_transport(), polling_interval=60,
+                         history_size=10)
+    push_later(sleeper.callback_url, {'status': 'PENDING'}, delay=0.05)
+    thread = push_later(sleeper.callback_url, {'status': 'ERROR'})
+    with pytest.raises(Alarm) as exc_info:
+        sleeper.run()
+    thread.join()
+    # The pushed payloads are recorded after the poll
+    history = exc_info.value.history
+    assert [record.outcome for record in history] == ['pending', 'pending', 'alarm']
+    assert history[-1].latency is None
+    assert history[-1].condition == 0
+
+
+def test_fallback_poll(receiver):
+    transport = pending_transport()
+    sleeper = HttSleeper(URL, {'json': {'status': 'OK'}}, webhook=receiver,
+                         transport=transport, polling_interval=0, max_retries=3)
+    with pytest.raises(StopIteration):
+        sleeper.run()
+    assert transport.send.call_count == 3
+
+
+def test_cancel_wakes_webhook_wait(receiver):
+    sleeper = HttSleeper(URL, {'json': {'status': 'OK'}}, webhook=receiver,
+                         transport=pending_transport(), polling_interval=60)
+    timer = threading.Timer(0.1, sleeper.cancel)
+    timer.start()
+    started = time.time()
+    with pytest.raises(Cancelled):
+        sleeper.run()
+    assert time.time() - started < 5
+
+
+def test_no_webhook():
+    assert HttSleeper(URL, {'status_code': 200}).callback_url is None